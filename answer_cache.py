@@ -0,0 +1,176 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """LRU + TTL cache of answers, matched by cosine similarity of question embeddings.
+
+    Entries are partitioned by (source option, corpus version, article numbers):
+    only questions asked against the same sources, over the same ingested
+    content and about the same articles can share an answer. Article numbers
+    are part of the key because "What does Article 1 say?" and "What does
+    Article 2 say?" embed almost identically.
+
+    With a `path`, put() only marks the cache dirty; it is written at most once
+    every `save_interval` seconds on a timer thread, and once more at exit.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl: float = 86400,
+                 path: Optional[str] = None, save_interval: float = 5):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._partitions: Dict[Tuple, List[str]] = {}
+        self._matrices: Dict[Tuple, np.ndarray] = {}
+        self._save_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self._dirty = False
+        if path:
+            self.load()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def partition_key(source_option: str, version: str, article_nums: Sequence[int] = ()) -> Tuple:
+        return (source_option, version, tuple(sorted(article_nums)))
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, partition: Tuple) -> Optional[str]:
+        with self._lock:
+            self._expire()
+            ids = self._partitions.get(partition)
+            if ids:
+                matrix = self._matrices.get(partition)
+                if matrix is None:
+                    matrix = np.stack([self._entries[i]["embedding"] for i in ids])
+                    self._matrices[partition] = matrix
+                scores = matrix @ self._normalize(embedding)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id]["answer"]
+            self.misses += 1
+            return None
+
+    def put(self, embedding, partition: Tuple, question: str, answer: str):
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            self._entries[entry_id] = {
+                "embedding": self._normalize(embedding),
+                "partition": partition,
+                "question": question,
+                "answer": answer,
+                "created_at": time.time(),
+            }
+            self._partitions.setdefault(partition, []).append(entry_id)
+            self._matrices.pop(partition, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            if self.path:
+                self._dirty = True
+                if self._save_timer is None:
+                    self._save_timer = threading.Timer(self.save_interval, self.flush)
+                    self._save_timer.daemon = True
+                    self._save_timer.start()
+
+    def flush(self):
+        """Write the cache now if anything was added since the last write."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+        self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+            self._matrices.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id)
+        partition = entry["partition"]
+        ids = self._partitions.get(partition, [])
+        ids.remove(entry_id)
+        if not ids:
+            self._partitions.pop(partition, None)
+        self._matrices.pop(partition, None)
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        # Entries are kept in insertion/use order, but a recently used entry can
+        # still be old, so check them all; the cache is small.
+        for entry_id in [i for i, e in self._entries.items() if e["created_at"] < cutoff]:
+            self._remove(entry_id)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading answer cache from {self.path}: {e}")
+            return
+        with self._lock:
+            self.clear()
+            for entry_id, entry in data.get("entries", {}).items():
+                partition = (entry["partition"][0], entry["partition"][1], tuple(entry["partition"][2]))
+                self._entries[entry_id] = {
+                    **entry,
+                    "embedding": np.asarray(entry["embedding"], dtype=np.float32),
+                    "partition": partition,
+                }
+                self._partitions.setdefault(partition, []).append(entry_id)
+            self._expire()
+
+    def save(self):
+        # Saves are serialized by their own lock, so questions are not held up while the file is written
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    "version": 1,
+                    "entries": {
+                        entry_id: {**entry, "embedding": entry["embedding"].tolist(), "partition": list(entry["partition"])}
+                        for entry_id, entry in self._entries.items()
+                    },
+                }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,157 @@
+import base64
+import binascii
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from settings import API_HOST, API_PORT, STREAM_ANSWERS
+from resources import get_registry
+from constitution_qa import (
+    SOURCE_COLLECTIONS,
+    check_vectorstore,
+    ensure_constitution_loaded,
+    finish_answer,
+    get_memory,
+    get_vectorstore,
+    ingest_constitution_text,
+    ingest_files,
+    prepare_answer,
+    recall_history,
+    start_chat_compaction,
+)
+from ingestion import collection_count
+from tracing import tracer
+
+
+class AskRequest(BaseModel):
+    question: str
+    source: str = "Constitution"
+    stream: bool = STREAM_ANSWERS
+    # Pass the same id on follow-up questions to give the model the conversation so far
+    session_id: Optional[str] = None
+
+
+class UploadedFile(BaseModel):
+    name: str
+    content_base64: str
+
+
+class IngestRequest(BaseModel):
+    files: List[UploadedFile] = []
+    constitution_text: Optional[str] = None
+
+
+def _source_metadata(docs):
+    return [doc.metadata for doc in docs]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    check_vectorstore()
+    ensure_constitution_loaded()
+    start_chat_compaction()
+    yield
+
+
+app = FastAPI(title="Kazakhstan Constitution Assistant", lifespan=lifespan)
+
+
+# Handlers are plain `def` so FastAPI runs them on its thread pool: concurrent
+# questions reach the query embedding batcher together instead of one by one.
+@app.post("/ask")
+def ask(request: AskRequest):
+    if request.source not in SOURCE_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"source must be one of {list(SOURCE_COLLECTIONS)}")
+    memory = get_memory(request.session_id) if request.session_id else None
+    qa_chain, answer, docs, query_embedding, cache_partition, context_stats = prepare_answer(
+        request.question, request.source, memory)
+    cached = answer is not None
+    chat_history = "" if cached else recall_history(memory, request.question, query_embedding)
+
+    if not request.stream:
+        if not cached:
+            answer = qa_chain.run(request.question, docs, chat_history)
+        finish_answer(request.question, answer, query_embedding, cache_partition, cached, memory)
+        return {"answer": answer, "cached": cached, "sources": _source_metadata(docs), "context": context_stats,
+                "session_id": request.session_id}
+
+    def tokens():
+        if cached:
+            yield answer
+            finish_answer(request.question, answer, query_embedding, cache_partition, cached, memory)
+            return
+        parts = []
+        for token in qa_chain.stream(request.question, docs, chat_history):
+            parts.append(token)
+            yield token
+        finish_answer(request.question, "".join(parts), query_embedding, cache_partition, memory=memory)
+
+    return StreamingResponse(tokens(), media_type="text/plain; charset=utf-8",
+                             headers={"X-Answer-Cached": str(cached).lower(),
+                                      "X-Prompt-Tokens-Saved": str((context_stats or {}).get("tokens_saved", 0))})
+
+
+@app.post("/ingest")
+def ingest(request: IngestRequest):
+    result = {}
+    if request.constitution_text:
+        loaded = ingest_constitution_text(request.constitution_text)
+        result["constitution"] = (
+            {"skipped": True} if loaded is None
+            else {"articles": loaded[0], "new_or_changed": loaded[1]}
+        )
+    if request.files:
+        try:
+            files = [(f.name, base64.b64decode(f.content_base64, validate=True)) for f in request.files]
+        except (binascii.Error, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid base64 file content: {e}")
+        added, skipped = ingest_files(files)
+        result["files"] = {"new_or_changed": added, "skipped": skipped}
+    if not result:
+        raise HTTPException(status_code=400, detail="Nothing to ingest: send files and/or constitution_text")
+    return result
+
+
+@app.get("/articles/{article_num}")
+def article(article_num: int):
+    doc = get_registry().article_index().get(article_num)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Article {article_num} not found")
+    return {"article": article_num, "text": doc.page_content, "metadata": doc.metadata}
+
+
+@app.get("/health")
+def health():
+    registry = get_registry()
+    status = {"status": "ok"}
+    try:
+        status["collections"] = {
+            name: collection_count(get_vectorstore(name))
+            for name in sorted({n for names in SOURCE_COLLECTIONS.values() for n in names})
+        }
+    except Exception as e:
+        status["status"] = "degraded"
+        status["vectorstore_error"] = str(e)
+    status["articles"] = len(registry.article_index())
+    status["ollama"] = registry.llm().client.ping()
+    if not status["ollama"]:
+        status["status"] = "degraded"
+    status["query_batching"] = registry.query_embeddings().stats()
+    if registry.answer_cache() is not None:
+        status["answer_cache"] = registry.answer_cache().stats()
+    return status
+
+
+@app.get("/metrics")
+def metrics(format: str = "prometheus"):
+    if format == "json":
+        return tracer.snapshot()
+    return PlainTextResponse(tracer.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
@@ -0,0 +1,218 @@
+import json
+import os
+import re
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Union
+
+from langchain.schema import Document
+
+from settings import DB_DIR
+
+ARTICLE_INDEX_FILE = "article_index.json"
+
+# A number after the first only belongs to the reference if the reference ends or continues right after it:
+# "Articles 5, 12 and 93 say" is a list, "article 5 and 2 other things" is not
+_REF_END = (r'(?=\s*(?:$|[-–—,.;:?!)\]&]|(?:and|or|to|through|of|in|on|about|is|are|say|says|state|states|mean|means'
+            r'|cover|covers|provide|provides|define|defines|guarantee|guarantees|regulate|regulates)\b))')
+_ARTICLE_REF = re.compile(
+    r'\b(articles?)\s+(\d+(?:\s*(?:-|–|—|,|\band\b|\bto\b|\bthrough\b|&)\s*\d+' + _REF_END + r')*)',
+    re.IGNORECASE
+)
+_RANGE = re.compile(r'(\d+)\s*(-|–|—|\bto\b|\bthrough\b)\s*(\d+)', re.IGNORECASE)
+_MAX_RANGE = 99
+
+_HEADING = re.compile(r'Article\s+(\d+)', re.IGNORECASE)
+# "Article 7 of the Constitution", "Article 41 as amended", "Article 83-1", "Article 47(1)"
+_REFERENCE_AFTER = re.compile(r'(?:\s*[,;()\-–]|[ \t]+(?:of|as|is|was|were|and|or|for|in|to|shall|hereof|paragraph)\b)')
+_REFERENCE_BEFORE = re.compile(r'(?:\b(?:of|in|see|and|by|under|to|with|per|footnote)|[,(])[\s.:]*$', re.IGNORECASE)
+_NOTE = re.compile(r'Note\.\s+[^\n]*')
+_CONTEXT = 32
+
+
+def parse_article_numbers(question: str) -> List[int]:
+    """Article numbers referenced in a question, in the order they appear.
+
+    Understands single articles ("Article 5"), ranges ("Articles 40-44",
+    "articles 40 to 44", also written backwards as "Articles 44-40") and
+    lists ("Articles 5, 12 and 93").
+    """
+    numbers = []
+    for match in _ARTICLE_REF.finditer(question):
+        plural, refs = match.group(1).lower() == "articles", match.group(2)
+        for range_match in _RANGE.finditer(refs):
+            start, dash, end = int(range_match.group(1)), range_match.group(2), int(range_match.group(3))
+            if start > end and not plural and dash in "-–—":
+                # "Article 83-1" is an inserted article numbered under 83, not articles 83 and 1
+                numbers.append(start)
+            elif abs(end - start) < _MAX_RANGE:
+                numbers.extend(range(min(start, end), max(start, end) + 1))
+            else:
+                numbers.extend([start, end])
+        numbers.extend(int(n) for n in re.findall(r'\d+', _RANGE.sub(' ', refs)))
+    seen = set()
+    return [n for n in numbers if not (n in seen or seen.add(n))]
+
+
+class ArticleSegmenter:
+    """Single-pass splitter of constitution text into one Document per article.
+
+    Text is fed in chunks (e.g. PDF pages); only the article being assembled
+    and a short lookahead are held in memory. A marker starts a new article
+    when it is a heading: at the start of a line and numbered above the current
+    article, or, for text without line breaks, the next article in sequence and
+    not worded like a cross-reference.
+    """
+
+    def __init__(self, source: str = "Constitution"):
+        self.source = source
+        self.docs: List[Document] = []
+        self._current: Optional[int] = None
+        self._parts: List[str] = []
+        self._pending = ""
+        self._before = "\n"
+
+    def feed(self, text: str, final: bool = False):
+        text = self._pending + text.replace('\r\n', '\n').replace('\r', '\n')
+        # Markers in the last stretch wait for more text, unless none is coming
+        limit = len(text) if final else len(text) - 2 * _CONTEXT
+        pos = 0
+        for match in _HEADING.finditer(text):
+            if match.start() >= limit:
+                break
+            if self._is_heading(text, match):
+                self._consume(text[pos:match.start()])
+                self._emit()
+                self._current = int(match.group(1))
+                pos = match.end()
+        cut = max(pos, limit)
+        self._consume(text[pos:cut])
+        self._before = (self._before + text[:cut])[-_CONTEXT:]
+        self._pending = text[cut:]
+
+    def close(self) -> List[Document]:
+        self.feed("", final=True)
+        self._emit()
+        return self.docs
+
+    def _is_heading(self, text: str, match) -> bool:
+        start = match.start()
+        before = text[max(0, start - _CONTEXT):start]
+        if start < _CONTEXT:
+            before = self._before + before
+        after = text[match.end():match.end() + _CONTEXT]
+        if _REFERENCE_AFTER.match(after):
+            return False
+
+        article_num = int(match.group(1))
+        at_line_start = before.rstrip(' \t').endswith('\n')
+        if self._current is None:
+            return at_line_start or article_num == 1
+        if at_line_start:
+            return article_num > self._current
+        return article_num == self._current + 1 and not _REFERENCE_BEFORE.search(before)
+
+    def _consume(self, text: str):
+        if self._current is not None and text:
+            self._parts.append(text)
+
+    def _emit(self):
+        if self._current is None:
+            return
+        content = _NOTE.sub('', "".join(self._parts))
+        content = re.sub(r'\s+', ' ', content).strip()
+        content = re.sub(r'^[.:\s]+', '', content)
+        self._parts = []
+        if not content:
+            print(f"Empty content for Article {self._current}, skipping")
+            return
+        self.docs.append(Document(
+            page_content=f"Article {self._current}. {content}",
+            metadata={"source": self.source, "article": self._current}
+        ))
+
+
+def segment_articles(text: Union[str, Iterable[str]], source: str = "Constitution") -> List[Document]:
+    segmenter = ArticleSegmenter(source)
+    for chunk in ([text] if isinstance(text, str) else text):
+        segmenter.feed(chunk)
+    return segmenter.close()
+
+
+class ArticleIndex:
+    """In-memory article number -> Document map, persisted next to the vectorstore."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(DB_DIR, ARTICLE_INDEX_FILE)
+        self._articles: Dict[int, Document] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._articles)
+
+    def __contains__(self, article_num):
+        return article_num in self._articles
+
+    def get(self, article_num: int) -> Optional[Document]:
+        return self._articles.get(article_num)
+
+    def lookup(self, article_nums: Iterable[int]) -> List[Document]:
+        return [self._articles[n] for n in article_nums if n in self._articles]
+
+    def update(self, docs: Iterable[Document], save: bool = True) -> int:
+        added = 0
+        with self._lock:
+            for doc in docs:
+                article_num = (doc.metadata or {}).get("article")
+                if article_num is None:
+                    continue
+                self._articles[int(article_num)] = doc
+                added += 1
+        if added and save:
+            self.save()
+        return added
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            articles = {
+                int(num): Document(page_content=item["page_content"], metadata=item.get("metadata", {}))
+                for num, item in data.get("articles", {}).items()
+            }
+        except Exception as e:
+            print(f"Error loading article index from {self.path}: {e}")
+            return False
+        with self._lock:
+            self._articles = articles
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": 1,
+                "articles": {
+                    str(num): {"page_content": doc.page_content, "metadata": doc.metadata}
+                    for num, doc in sorted(self._articles.items())
+                },
+            }
+            # A temp file of our own, so two threads saving at once cannot replace each other's
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def rebuild_from_vectorstore(self, vectorstore) -> int:
+        try:
+            stored = vectorstore.get(where={"article": {"$gte": 0}}, include=["documents", "metadatas"])
+        except Exception as e:
+            print(f"Error reading articles from vectorstore: {e}")
+            return 0
+        docs = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(stored.get("documents") or [], stored.get("metadatas") or [])
+        ]
+        return self.update(docs)
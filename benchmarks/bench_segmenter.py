@@ -0,0 +1,67 @@
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.document_loaders import PyMuPDFLoader
+
+from articles import segment_articles
+from constitution_qa import clean_constitution_page
+
+CONSTITUTION_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data", "akorda.kz-Constitution of the Republic of Kazakhstan.pdf"
+)
+
+
+def load_pages():
+    loader = PyMuPDFLoader(CONSTITUTION_PATH)
+    return [clean_constitution_page(doc.page_content) for doc in loader.lazy_load()]
+
+
+def synthetic_pages(pages, copies):
+    # Renumber the article headings of every copy so the result reads as one long document
+    heading = re.compile(r'^([ \t]*Article\s+)(\d+)', re.MULTILINE)
+    for copy in range(copies):
+        offset = copy * 100
+        for page in pages:
+            yield heading.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + offset}", page)
+
+
+def run(name, make_pages, repeat):
+    timings = []
+    for _ in range(repeat):
+        pages = list(make_pages())
+        chars = sum(len(page) for page in pages)
+        start = time.perf_counter()
+        docs = segment_articles(iter(pages))
+        timings.append(time.perf_counter() - start)
+    elapsed = min(timings)
+
+    # Peak memory is measured on a streamed run, the way load_constitution_from_file feeds pages
+    tracemalloc.start()
+    segment_articles(make_pages())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<14} {chars / 1e6:7.2f} MB {len(docs):6d} articles {elapsed * 1000:9.1f} ms "
+          f"{chars / 1e6 / elapsed:7.2f} MB/s  peak {peak / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Article segmenter throughput")
+    parser.add_argument("--copies", type=int, default=100, help="size multiplier for the synthetic input")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages()
+    run("constitution", lambda: iter(pages), args.repeat)
+    run(f"synthetic x{args.copies}", lambda: synthetic_pages(pages, args.copies), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_ollama import FakeOllamaServer
+
+SOURCE_OPTIONS = ["Constitution", "Uploaded Documents", "Both"]
+
+QUESTIONS = [
+    "What does Article 1 say?",
+    "Who is the head of state?",
+    "How is the President elected?",
+    "What rights do citizens have to freedom of speech?",
+    "What are Articles 40-42 about?",
+    "Can the Constitution be amended by referendum?",
+    "What is the role of the Parliament?",
+    "How are judges appointed?",
+    "What does the uploaded memo say about fisheries quotas?",
+    "What is the official language of the state?",
+    "Who can dissolve the Mazhilis?",
+    "What does Article 93 require of the Government?",
+]
+
+
+def summarize(samples):
+    values = np.asarray(samples, dtype=float) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def bench_constitution_ingestion(repeat):
+    from constitution_qa import load_constitution_from_file
+    timings, articles = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        articles = len(load_constitution_from_file())
+        timings.append(time.perf_counter() - start)
+    return {"articles": articles, "best_s": min(timings), "mean_s": sum(timings) / len(timings)}
+
+
+def synthetic_upload_files(count):
+    # Plain-text copies of the constitution, each made unique so none are skipped as already ingested
+    from constitution_qa import load_constitution_from_file
+    text = "\n\n".join(doc.page_content for doc in load_constitution_from_file())
+    return [(f"synthetic_{i}.txt", f"Document {i}\n{text}".encode("utf-8")) for i in range(count)]
+
+
+def bench_upload_ingestion(files):
+    from constitution_qa import ingest_files, get_vectorstore
+    from resources import get_registry
+    from settings import UPLOADS_COLLECTION
+    total_bytes = sum(len(data) for _, data in files)
+    # Tokenizer, embedding model and collection load once per process; time them apart from throughput
+    start = time.perf_counter()
+    registry = get_registry()
+    registry.text_splitter().split_text("warm up")
+    registry.embeddings().embed_documents(["warm up"])
+    get_vectorstore(UPLOADS_COLLECTION)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks, _ = ingest_files(files)
+    elapsed = time.perf_counter() - start
+    return {
+        "load_seconds": load_seconds,
+        "files": len(files),
+        "megabytes": total_bytes / 1e6,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "docs_per_s": len(files) / elapsed,
+        "chunks_per_s": chunks / elapsed,
+        "mb_per_s": total_bytes / 1e6 / elapsed,
+    }
+
+
+def startup_probe():
+    """Runs in a fresh interpreter: time imports, then everything main() does before it can answer."""
+    start = time.perf_counter()
+    import constitution_qa
+    imported = time.perf_counter()
+    loaded = constitution_qa.ensure_constitution_loaded()
+    qa_chain = constitution_qa.get_qa_chain("Constitution")
+    constitution_qa.retrieve_context(qa_chain, QUESTIONS[1], "Constitution")
+    ready = time.perf_counter()
+    print(json.dumps({"import_s": imported - start, "ready_s": ready - start, "documents_loaded": loaded}))
+
+
+def bench_startup(env):
+    def run():
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--startup-probe"],
+                                cwd=ROOT, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise RuntimeError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    shutil.rmtree(env["CQA_DB_DIR"], ignore_errors=True)
+    return {"cold": run(), "warm": run()}
+
+
+def bench_retrieval(rounds):
+    from constitution_qa import get_qa_chain, retrieve_context
+    results = {}
+    for source_option in SOURCE_OPTIONS:
+        qa_chain = get_qa_chain(source_option)
+        retrieve_context(qa_chain, QUESTIONS[0], source_option)  # builds keyword indexes
+        samples = []
+        for _ in range(rounds):
+            for question in QUESTIONS:
+                start = time.perf_counter()
+                retrieve_context(qa_chain, question, source_option)
+                samples.append(time.perf_counter() - start)
+        results[source_option] = summarize(samples)
+    return results
+
+
+def bench_end_to_end(users, questions_per_user, source_option, stream):
+    from constitution_qa import prepare_answer, finish_answer
+
+    def ask(question):
+        start = time.perf_counter()
+        first_token = None
+        qa_chain, answer, docs, query_embedding, cache_partition, _ = prepare_answer(question, source_option)
+        cached = answer is not None
+        if not cached:
+            if stream:
+                parts = []
+                for token in qa_chain.stream(question, docs):
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(token)
+                answer = "".join(parts)
+            else:
+                answer = qa_chain.run(question, docs)
+        finish_answer(question, answer, query_embedding, cache_partition, cached)
+        total = time.perf_counter() - start
+        return total, first_token if first_token is not None else total
+
+    def user(user_id):
+        return [ask(QUESTIONS[(user_id + i) % len(QUESTIONS)]) for i in range(questions_per_user)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        samples = [sample for result in executor.map(user, range(users)) for sample in result]
+    elapsed = time.perf_counter() - start
+    return {
+        "users": users,
+        "questions": len(samples),
+        "source": source_option,
+        "stream": stream,
+        "seconds": elapsed,
+        "questions_per_s": len(samples) / elapsed,
+        "latency": summarize([total for total, _ in samples]),
+        "time_to_first_token": summarize([first for _, first in samples]),
+    }
+
+
+def main():
+    output_dir = os.getcwd()
+    parser = argparse.ArgumentParser(description="Offline benchmark suite; writes results as JSON")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--only", nargs="*", default=None,
+                        choices=["constitution", "uploads", "startup", "retrieval", "end_to_end"])
+    parser.add_argument("--embeddings", default="fake", choices=["fake", "torch", "onnx"],
+                        help="embedding backend; fake needs no model download")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--upload-files", type=int, default=20)
+    parser.add_argument("--retrieval-rounds", type=int, default=5)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--questions-per-user", type=int, default=5)
+    parser.add_argument("--source", default="Both", choices=SOURCE_OPTIONS)
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM seconds to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=64)
+    parser.add_argument("--db-dir", default=None, help="use this vectorstore directory instead of a temporary one")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe()
+        return
+
+    selected = set(args.only or ["constitution", "uploads", "startup", "retrieval", "end_to_end"])
+    work_dir = tempfile.mkdtemp(prefix="cqa_bench_")
+    server = FakeOllamaServer(latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second,
+                              tokens=args.llm_tokens).start()
+    # Settings are read at import, so the environment must be in place before any project import
+    os.environ.update({
+        "CQA_DB_DIR": args.db_dir or os.path.join(work_dir, "vectorstore"),
+        "CQA_EMBEDDING_BACKEND": args.embeddings,
+        "OLLAMA_BASE_URL": server.url,
+        "CQA_ANSWER_CACHE": "0",
+        "CQA_ANSWER_CACHE_PERSIST": "0",
+    })
+    os.chdir(ROOT)  # CONSTITUTION_PATH is relative to the repository root
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("startup_probe", "output")},
+        "results": {},
+    }
+
+    try:
+        if "startup" in selected:
+            env = {**os.environ, "CQA_DB_DIR": os.path.join(work_dir, "startup_vectorstore")}
+            results["results"]["startup"] = bench_startup(env)
+            print(f"startup: {results['results']['startup']}")
+        if "constitution" in selected:
+            results["results"]["constitution_ingestion"] = bench_constitution_ingestion(args.repeat)
+            print(f"constitution ingestion: {results['results']['constitution_ingestion']}")
+
+        from constitution_qa import ensure_constitution_loaded
+        ensure_constitution_loaded()
+        if "uploads" in selected:
+            files = synthetic_upload_files(args.upload_files)
+            results["results"]["upload_ingestion"] = bench_upload_ingestion(files)
+            print(f"upload ingestion: {results['results']['upload_ingestion']}")
+        if "retrieval" in selected:
+            results["results"]["retrieval"] = bench_retrieval(args.retrieval_rounds)
+            print(f"retrieval: {json.dumps(results['results']['retrieval'], indent=1)}")
+        if "end_to_end" in selected:
+            requests_before = server.requests
+            result = bench_end_to_end(args.users, args.questions_per_user, args.source, not args.no_stream)
+            result["llm_requests"] = server.requests - requests_before
+            results["results"]["end_to_end"] = result
+            print(f"end to end: {json.dumps(result, indent=1)}")
+        if "tracing" in sys.modules:
+            results["stages"] = sys.modules["tracing"].tracer.snapshot()
+    finally:
+        if "constitution_qa" in sys.modules:
+            # Flush queued chat turns while the vectorstore directory still exists
+            sys.modules["constitution_qa"].get_chat_writer().close()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = os.path.join(output_dir, args.output)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
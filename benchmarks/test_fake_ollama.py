@@ -0,0 +1,15 @@
+import time
+
+from fake_ollama import FakeOllamaServer
+from llm import OllamaClient
+
+
+def test_streams_the_configured_number_of_tokens():
+    with FakeOllamaServer(latency=0.05, tokens_per_second=1000, tokens=10) as server:
+        client = OllamaClient(base_url=server.url)
+        start = time.perf_counter()
+        tokens = list(client.stream("question"))
+        assert len(tokens) == 10
+        assert time.perf_counter() - start >= 0.05
+        assert client.ping()
+        assert server.requests == 1
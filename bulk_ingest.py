@@ -0,0 +1,148 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+from ingestion import SUPPORTED_SUFFIXES
+
+
+def discover(paths: List[str]) -> List[Path]:
+    """Every PDF/DOCX/TXT file under `paths`, in a stable order so interrupted runs resume the same way."""
+    found = []
+    for path in map(Path, paths):
+        if path.is_file():
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            found.extend(Path(root) / name for name in sorted(files))
+    return [path for path in found if path.suffix.lower() in SUPPORTED_SUFFIXES]
+
+
+def source_name(path: Path) -> str:
+    # Relative to the working directory, so two files called report.pdf in different folders stay apart
+    return Path(os.path.relpath(path)).as_posix()
+
+
+def rounds(files: List[Path], max_files: int, max_bytes: int):
+    batch, size = [], 0
+    for path in files:
+        file_size = path.stat().st_size
+        if batch and (len(batch) >= max_files or size + file_size > max_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append(path)
+        size += file_size
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest a directory tree of PDF/DOCX/TXT files into the uploads collection, out of the web process"
+    )
+    parser.add_argument("paths", nargs="*", help="files or directories to ingest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parse worker processes")
+    parser.add_argument("--batch-size", type=int, default=1024, help="chunks embedded per call")
+    parser.add_argument("--round-files", type=int, default=64, help="files read and parsed together")
+    parser.add_argument("--round-mb", type=float, default=256, help="max MB of files held in memory per round")
+    parser.add_argument("--constitution", action="store_true", help="also (re)load the bundled constitution PDF")
+    parser.add_argument("--constitution-text", help="text file with the constitution to ingest")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete chunks of previously ingested files under the given directories that no longer exist")
+    parser.add_argument("--report", help="write the run statistics as JSON to this file")
+    args = parser.parse_args()
+    if not (args.paths or args.constitution or args.constitution_text):
+        parser.error("nothing to ingest: give paths, --constitution or --constitution-text")
+
+    from constitution_qa import (
+        ensure_constitution_loaded,
+        get_keyword_index,
+        get_vectorstore,
+        ingest_constitution_text,
+        ingest_files,
+    )
+    from ingestion import remove_source
+    from resources import get_registry
+    from settings import UPLOADS_COLLECTION
+    from tracing import tracer
+
+    registry = get_registry()
+    # Our own pool rather than the app's, which is sized by CQA_PARSE_WORKERS
+    executor = ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=multiprocessing.get_context("spawn"))
+    stats = {"files": 0, "skipped": 0, "chunks": 0, "pruned_chunks": 0, "bytes": 0}
+    start = time.perf_counter()
+
+    def rate(count):
+        elapsed = time.perf_counter() - start
+        return count / elapsed if elapsed > 0 else 0.0
+
+    try:
+        if args.constitution:
+            loaded = ensure_constitution_loaded()
+            print(f"Constitution: {loaded} documents loaded" if loaded else "Constitution already loaded")
+        if args.constitution_text:
+            with open(args.constitution_text, "r", encoding="utf-8") as f:
+                result = ingest_constitution_text(f.read())
+            print("Constitution text already loaded" if result is None
+                  else f"Constitution text: {result[0]} articles, {result[1]} new or changed")
+
+        files = discover(args.paths)
+        print(f"Found {len(files)} files under {', '.join(args.paths) or '-'} using {args.workers} parse workers")
+        done = 0
+        for batch in rounds(files, args.round_files, int(args.round_mb * 1024 * 1024)):
+            contents = [(source_name(path), path.read_bytes()) for path in batch]
+            # Files whose bytes are already in the manifest are skipped before parsing; the manifest is
+            # saved after every round, so a rerun after an interruption resumes at the first unfinished round
+            added, skipped = ingest_files(contents, replace_sources=True, executor=executor,
+                                          batch_size=args.batch_size)
+            done += len(batch)
+            stats["files"] += len(batch) - len(skipped)
+            stats["skipped"] += len(skipped)
+            stats["chunks"] += added
+            stats["bytes"] += sum(len(data) for name, data in contents if name not in skipped)
+            print(f"[{done}/{len(files)}] {stats['files']} ingested, {stats['skipped']} already loaded, "
+                  f"{stats['chunks']} chunks embedded | {rate(stats['files']):.1f} docs/s, "
+                  f"{rate(stats['chunks']):.1f} chunks/s, {rate(stats['bytes']) / 1024 / 1024:.2f} MB/s")
+
+        if args.prune:
+            present = {source_name(path) for path in files}
+            roots = [source_name(Path(path)).rstrip("/") + "/" for path in args.paths if Path(path).is_dir()]
+            manifest = registry.manifest()
+            for name in list(manifest.sources.get(UPLOADS_COLLECTION, {})):
+                if name not in present and any(name.startswith(root) for root in roots):
+                    removed = remove_source(get_vectorstore(UPLOADS_COLLECTION), UPLOADS_COLLECTION, name,
+                                            manifest, keyword_index=get_keyword_index(UPLOADS_COLLECTION), save=False)
+                    stats["pruned_chunks"] += removed
+                    print(f"Pruned {removed} chunks of {name}")
+            manifest.save()
+    except KeyboardInterrupt:
+        print("Interrupted; completed rounds are recorded, rerun the same command to resume")
+        sys.exit(130)
+    finally:
+        for pool in (executor, registry._parse_executor):
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "seconds": elapsed,
+        "docs_per_second": stats["files"] / elapsed if elapsed else 0.0,
+        "chunks_per_second": stats["chunks"] / elapsed if elapsed else 0.0,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+    })
+    print(f"Done in {elapsed:.1f} s: {stats['files']} files, {stats['chunks']} chunks, "
+          f"{stats['docs_per_second']:.1f} docs/s, {stats['chunks_per_second']:.1f} chunks/s")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"stats": stats, "stages": tracer.snapshot()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from langchain.schema import Document
+
+from settings import CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_FLUSH_SECONDS
+from tracing import span, incr
+
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    """Background writer that persists chat turns to the chat_history collection in batches.
+
+    submit() only enqueues, so the answer path never waits for an embedding
+    pass or a Chroma write. The worker flushes when batch_size turns are queued
+    or flush_interval seconds after the oldest pending one, with one
+    embed_documents call and one insert per batch. close() (also run at
+    interpreter exit) drains the queue before returning.
+    """
+
+    def __init__(self, vectorstore, batch_size: int = CHAT_WRITE_BATCH_SIZE,
+                 flush_interval: float = CHAT_WRITE_FLUSH_SECONDS):
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        # Held for each write; compaction takes it to replace the collection safely
+        self.lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, question: str, answer: str, metadata: Optional[dict] = None):
+        if self._closed:
+            self._write([self._to_document(question, answer, metadata)])
+            return
+        self._queue.put(self._to_document(question, answer, metadata))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: Optional[float] = 30):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    @staticmethod
+    def _to_document(question: str, answer: str, metadata: Optional[dict]) -> Document:
+        return Document(
+            page_content=f"Q: {question}\nA: {answer}",
+            metadata={"timestamp": datetime.now().isoformat(), **(metadata or {})}
+        )
+
+    def _run(self):
+        batch: List[Document] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(batch)
+                return
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+
+    def _follow_rebuild(self):
+        # Compaction in another process replaces chat_history under a new id; write to the live collection
+        collection = getattr(self.vectorstore, "_collection", None)
+        if collection is None:
+            return
+        live = self.vectorstore._client.get_collection(collection.name)
+        if live.id != collection.id:
+            self.vectorstore._collection = live
+
+    def _write(self, batch: List[Document]):
+        if not batch:
+            return
+        try:
+            with self.lock, span("chat_write", turns=len(batch)):
+                self._follow_rebuild()
+                self.vectorstore.add_documents(batch)
+            self.written += len(batch)
+            incr("chat_turns_written", len(batch))
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error storing {len(batch)} chat interactions: {e}")
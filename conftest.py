@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Settings are read at import, so the test environment must be in place before any project module loads
+os.environ.setdefault("CQA_DB_DIR", tempfile.mkdtemp(prefix="cqa_test_"))
+os.environ.setdefault("CQA_EMBEDDING_BACKEND", "fake")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("CQA_SNAPSHOT_SEARCH", "0")
+os.environ.setdefault("CQA_ANSWER_CACHE_PERSIST", "0")
@@ -1,29 +1,32 @@
 import streamlit as st
 import os
-import shutil
-from pathlib import Path
-from datetime import datetime
-import chromadb
-from typing import List
+from typing import Iterator, List
 import re
+import time
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyMuPDFLoader, UnstructuredFileLoader
-from langchain_community.document_loaders import UnstructuredPDFLoader, Docx2txtLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.llms import Ollama
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain_community.document_loaders import PyMuPDFLoader, UnstructuredFileLoader
+from langchain_community.document_loaders import UnstructuredPDFLoader
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain.chains.combine_documents.stuff import StuffDocumentsChain
 from langchain_community.vectorstores import Chroma
-import torch
-
-DB_DIR = "vectorstore/"
-CHAT_COLLECTION = "chat_history"
-CONSTITUTION_COLLECTION = "constitution"
-UPLOADS_COLLECTION = "uploaded_docs"
+from langchain_core.vectorstores import VectorStoreRetriever
+
+from settings import DB_DIR, CHAT_COLLECTION, CONSTITUTION_COLLECTION, UPLOADS_COLLECTION, CONSTITUTION_PATH, STREAM_ANSWERS
+from settings import SNAPSHOT_SEARCH, CONTEXT_PACKING
+from settings import MEMORY_RECALL_K, MEMORY_LLM_SUMMARY, CHAT_COMPACT_INTERVAL_HOURS
+from settings import HYBRID_RETRIEVAL, RETRIEVAL_K, RETRIEVAL_FETCH_K, RETRIEVAL_WORKERS, DEBUG_LEVEL
+from settings import INTEGRITY_CHECK, EMBED_BATCH_SIZE, EXTERNAL_SYNC_SECONDS
+from resources import get_registry
+from articles import parse_article_numbers, segment_articles
+from chat_history import ChatHistoryWriter
+from snapshot import load_constitution_store
+from context import ContextPacker
+from maintenance import backup_chroma_files, hnsw_metadata, startup_check
+from memory import ConversationMemory, MemoryStore, CompactionScheduler, COMPACTION_LOCK, compact_chat_history, llm_summarizer
+from hybrid import HybridRetriever, KeywordIndex, collection_loader, retrieval_executor
+from tracing import tracer, span, record, incr
+from ingestion import content_hash, collection_count, ingest_documents, parse_files, chunk_documents
 
 CUSTOM_PROMPT = """You are a helpful AI assistant specializing in the Constitution of the Republic of Kazakhstan. Your task is to provide accurate and relevant information.
 
@@ -42,26 +45,16 @@ Chat History: {chat_history}
 
 Please answer:"""
 
-def initialize_vectorstore(embeddings, collection_name):
-    os.makedirs(DB_DIR, exist_ok=True)
-    
-    client_settings = chromadb.Settings(
-        is_persistent=True,
-        persist_directory=DB_DIR,
-        anonymized_telemetry=False
-    )
-    
+def initialize_vectorstore(embeddings, collection_name, chroma_client=None):
+    chroma_client = chroma_client or get_registry().chroma_client()
+
     try:
-        chroma_client = chromadb.PersistentClient(
-            path=DB_DIR,
-            settings=client_settings
-        )
         try:
             collection = chroma_client.get_collection(name=collection_name)
             print(f"Using existing collection: {collection_name}")
         except Exception:
             print(f"Creating new collection: {collection_name}")
-            collection = chroma_client.create_collection(name=collection_name)
+            collection = chroma_client.create_collection(name=collection_name, metadata=hnsw_metadata(collection_name))
 
         return Chroma(
             client=chroma_client,
@@ -77,7 +70,7 @@ def initialize_vectorstore(embeddings, collection_name):
                 chroma_client.delete_collection(name=collection_name)
             except:
                 pass
-            collection = chroma_client.create_collection(name=collection_name)
+            collection = chroma_client.create_collection(name=collection_name, metadata=hnsw_metadata(collection_name))
             return Chroma(
                 client=chroma_client,
                 collection_name=collection_name,
@@ -91,181 +84,384 @@ def initialize_vectorstore(embeddings, collection_name):
                 embedding_function=embeddings
             )
 
-def store_chat_interaction(vectorstore, question: str, answer: str):
+def check_vectorstore():
+    """Startup integrity check, once per process and before Chroma opens any collection.
+
+    Damaged collections and orphaned segments are only reported, for
+    maintenance.py to repair; the whole Chroma database is moved aside only
+    if the client cannot open it at all.
+    """
+    return get_registry().get_or_create(("integrity_check",), _check_vectorstore)
+
+def _check_vectorstore():
+    registry = get_registry()
+    result = None
+    if INTEGRITY_CHECK:
+        try:
+            # Check only: the API or another app may have these segments open, so repairs are left to maintenance.py
+            result = startup_check(DB_DIR, dry_run=True)
+        except Exception as e:
+            print(f"Error checking vectorstore: {e}")
+        if result is not None and (result["repaired"] or result["orphans"]):
+            print("Stop every app and API process using this database, then run python maintenance.py to repair it")
     try:
-        timestamp = datetime.now().isoformat()
-        doc = Document(page_content=f"Q: {question}\nA: {answer}",
-                      metadata={"timestamp": timestamp})
-        vectorstore.add_documents([doc])
+        if result is not None and result["status"] == "corrupt":
+            raise RuntimeError("chroma.sqlite3 failed its integrity check")
+        client = registry.chroma_client()
+        print(f"Found {len(client.list_collections())} existing collections")
+    except Exception as e:
+        print(f"Error accessing vectorstore, attempting cleanup: {e}")
+        registry.reset_chroma_client(keep=("integrity_check",))
+        backup_chroma_files(DB_DIR)
+        # The moved collections start empty, so their files must not be skipped as already loaded
+        manifest = registry.manifest()
+        for name in SOURCE_COLLECTIONS["Both"] + [CHAT_COLLECTION]:
+            if name != CONSTITUTION_COLLECTION or not SNAPSHOT_SEARCH:
+                manifest.forget_collection(name)
+        manifest.save()
+    return result
+
+def get_chat_writer(vectorstore=None) -> ChatHistoryWriter:
+    return get_registry().get_or_create(
+        ("chat_writer", CHAT_COLLECTION),
+        lambda: ChatHistoryWriter(vectorstore or get_vectorstore(CHAT_COLLECTION))
+    )
+
+def store_chat_interaction(vectorstore, question: str, answer: str, metadata=None):
+    try:
+        get_chat_writer(vectorstore).submit(question, answer, metadata)
     except Exception as e:
         print(f"Error storing chat interaction: {e}")
 
-def load_documents(files) -> List[Document]:
-    docs = []
-    for file in files:
-        suffix = Path(file.name).suffix.lower()
-        with open(f"temp_{file.name}", "wb") as f:
-            f.write(file.read())
-        path = f.name
+class QAChain:
+    """Retrieve, stuff the documents into CUSTOM_PROMPT and call the LLM, optionally streaming."""
+
+    def __init__(self, llm, retriever=None, prompt=None):
+        self.llm = llm
+        self.retriever = retriever
+        self.prompt = prompt or PromptTemplate(input_variables=["chat_history", "context", "question"], template=CUSTOM_PROMPT)
+
+    def retrieve(self, question: str, query_embedding=None) -> List[Document]:
+        if self.retriever is None:
+            return []
+        if isinstance(self.retriever, HybridRetriever):
+            return self.retriever.retrieve(question, query_embedding)
+        if query_embedding is not None and isinstance(self.retriever, VectorStoreRetriever) \
+                and self.retriever.search_type == "similarity":
+            return self.retriever.vectorstore.similarity_search_by_vector(query_embedding, **self.retriever.search_kwargs)
+        return self.retriever.invoke(question)
+
+    def build_prompt(self, question: str, docs: List[Document], chat_history: str = "") -> str:
+        with span("prompt_build", docs=len(docs)):
+            context = "\n\n".join(doc.page_content for doc in docs)
+            return self.prompt.format(question=question, context=context, chat_history=chat_history)
+
+    def stream(self, question: str, docs: List[Document], chat_history: str = "") -> Iterator[str]:
+        prompt = self.build_prompt(question, docs, chat_history)
+        incr("llm_requests")
+        start = time.perf_counter()
+        tokens = 0
+        for token in self.llm.stream(prompt):
+            if not tokens:
+                record("llm_first_token", time.perf_counter() - start)
+            tokens += 1
+            yield token
+        record("llm_completion", time.perf_counter() - start, tokens=tokens)
+        incr("llm_tokens", tokens)
+
+    def run(self, question: str, docs: List[Document], chat_history: str = "") -> str:
+        prompt = self.build_prompt(question, docs, chat_history)
+        incr("llm_requests")
+        with span("llm_completion"):
+            return self.llm.invoke(prompt)
+
+def get_vectorstore(collection_name):
+    registry = get_registry()
+    if collection_name == CONSTITUTION_COLLECTION and SNAPSHOT_SEARCH:
+        return registry.get_or_create(
+            ("vectorstore", collection_name),
+            lambda: load_constitution_store(registry.embeddings())
+        )
+    return registry.get_or_create(
+        ("vectorstore", collection_name),
+        lambda: initialize_vectorstore(registry.embeddings(), collection_name)
+    )
+
+SOURCE_COLLECTIONS = {
+    "Constitution": [CONSTITUTION_COLLECTION],
+    "Uploaded Documents": [UPLOADS_COLLECTION],
+    "Both": [CONSTITUTION_COLLECTION, UPLOADS_COLLECTION],
+}
 
+def get_keyword_index(collection_name) -> KeywordIndex:
+    return get_registry().get_or_create(
+        ("keyword_index", collection_name),
+        lambda: KeywordIndex(collection_loader(get_vectorstore(collection_name)))
+    )
+
+def build_retriever(source_option):
+    registry = get_registry()
+    if HYBRID_RETRIEVAL:
+        return HybridRetriever(
+            sources=[(get_vectorstore(name), get_keyword_index(name)) for name in SOURCE_COLLECTIONS[source_option]],
+            embeddings=registry.query_embeddings(),
+            executor=registry.get_or_create(("executor", "retrieval"), lambda: retrieval_executor(RETRIEVAL_WORKERS)),
+            k=RETRIEVAL_K,
+            fetch_k=RETRIEVAL_FETCH_K
+        )
+    if source_option == "Constitution":
+        return get_vectorstore(CONSTITUTION_COLLECTION).as_retriever(search_kwargs={"k": 5})
+    if source_option == "Uploaded Documents":
+        return get_vectorstore(UPLOADS_COLLECTION).as_retriever(search_kwargs={"k": 5})
+    const_retriever = get_vectorstore(CONSTITUTION_COLLECTION).as_retriever(search_kwargs={"k": 3})
+    uploaded_retriever = get_vectorstore(UPLOADS_COLLECTION).as_retriever(search_kwargs={"k": 2})
+    from langchain.retrievers import MergerRetriever
+    return MergerRetriever(retrievers=[const_retriever, uploaded_retriever])
+
+def get_qa_chain(source_option) -> QAChain:
+    registry = get_registry()
+    return registry.get_or_create(
+        ("qa_chain", source_option),
+        lambda: QAChain(registry.llm(), build_retriever(source_option))
+    )
+
+def retrieve_context(qa_chain: QAChain, question: str, source_option: str, query_embedding=None) -> List[Document]:
+    with span("retrieve", source=source_option):
+        docs = _retrieve_context(qa_chain, question, source_option, query_embedding)
+    incr("documents_retrieved", len(docs))
+    if DEBUG_LEVEL >= 2:
+        for doc in docs:
+            print(f"Retrieved {doc.metadata}:\n{doc.page_content}\n")
+    return docs
+
+def _retrieve_context(qa_chain: QAChain, question: str, source_option: str, query_embedding=None) -> List[Document]:
+    article_nums = parse_article_numbers(question)
+    if article_nums and source_option in ["Constitution", "Both"]:
+        article_docs = get_registry().article_index().lookup(article_nums)
+        if article_docs:
+            incr("article_index_hits")
+            if DEBUG_LEVEL >= 1:
+                print(f"Answering from article index: {[doc.metadata['article'] for doc in article_docs]}")
+            if source_option == "Both":
+                # The named articles replace the constitution search only; uploads are still searched
+                return article_docs + get_qa_chain("Uploaded Documents").retrieve(question, query_embedding)
+            return article_docs
+        print(f"Articles {article_nums} not in article index, falling back to similarity search")
+    return qa_chain.retrieve(question, query_embedding)
+
+def lookup_cached_answer(question: str, source_option: str, memory: ConversationMemory = None):
+    """Returns (cached answer or None, question embedding, cache partition); the last two are None without a cache.
+
+    A follow-up in a conversation ("and the second one?") depends on the history, which the cache
+    key does not cover, so with a non-empty memory the cache is neither read nor written.
+    """
+    registry = get_registry()
+    cache = registry.answer_cache()
+    if cache is None:
+        return None, None, None
+    with span("embed_query"):
+        query_embedding = registry.query_embeddings().embed_query(question)
+    if memory is not None and not memory.is_empty():
+        incr("cache_skipped_with_history")
+        return None, query_embedding, None
+    version = registry.manifest().corpus_version(SOURCE_COLLECTIONS[source_option])
+    partition = cache.partition_key(source_option, version, parse_article_numbers(question))
+    answer = cache.get(query_embedding, partition)
+    incr("cache_hits" if answer is not None else "cache_misses")
+    return answer, query_embedding, partition
+
+def pack_context(question: str, docs: List[Document]):
+    """Fit retrieved docs into the prompt token budget; returns (docs, packing stats or None)."""
+    if not CONTEXT_PACKING or not docs:
+        return docs, None
+    packer = get_registry().get_or_create(("context_packer",), ContextPacker)
+    with span("context_pack"):
+        packed, stats = packer.pack(question, docs, pinned=parse_article_numbers(question))
+    incr("prompt_context_tokens", stats["tokens_after"])
+    incr("prompt_tokens_saved", stats["tokens_saved"])
+    if DEBUG_LEVEL >= 1:
+        print(f"Context packed: {stats}")
+    return packed, stats
+
+def sync_external_ingestion() -> bool:
+    """Pick up collections that another process (bulk_ingest.py, maintenance.py) changed.
+
+    Chroma keeps each collection's HNSW index in memory and does not re-read
+    what another process wrote, so only the changed collections' indexes are
+    reopened and their keyword indexes updated by chunk id. A collection that
+    was rebuilt under a new id is dropped with everything built on it and
+    opened again on next use. Runs at most once per EXTERNAL_SYNC_SECONDS;
+    returns True if anything changed.
+    """
+    registry = get_registry()
+    manifest = registry.manifest()
+    manifest.reload_if_changed()
+    changes = manifest.pop_external_changes(EXTERNAL_SYNC_SECONDS)
+    if not changes:
+        return False
+    print(f"Collections changed by another process: {sorted(changes)}")
+    try:
+        for name, change in changes.items():
+            _sync_collection(name, change)
+    except Exception as e:
+        print(f"Cannot reopen only the changed collections ({e}); falling back to reopening the whole vectorstore")
+        incr("external_sync_full_resets")
+        had_compactor = registry.cached(("chat_compactor",)) is not None
+        registry.reset_chroma_client(keep=("memories", "context_packer", "executor", "integrity_check"))
+        if had_compactor:
+            start_chat_compaction()
+    if CONSTITUTION_COLLECTION in changes:
+        registry.article_index().load()
+    incr("external_ingestion_syncs")
+    return True
+
+def _sync_collection(name: str, change: dict):
+    registry = get_registry()
+    vectorstore = registry.cached(("vectorstore", name))
+    snapshot = name == CONSTITUTION_COLLECTION and SNAPSHOT_SEARCH
+    collection_id = None if vectorstore is None or snapshot else vectorstore._collection.id
+    if not snapshot and registry.reopen_collection(name, collection_id):
+        index = registry.cached(("keyword_index", name))
+        if vectorstore is not None and index is not None and index.loaded:
+            index.delete(change["removed"])
+            changed = sorted(change["changed"])
+            for start in range(0, len(changed), EMBED_BATCH_SIZE):
+                stored = vectorstore.get(ids=changed[start:start + EMBED_BATCH_SIZE], include=["documents", "metadatas"])
+                index.upsert(stored["ids"], [Document(page_content=text or "", metadata=metadata or {})
+                                             for text, metadata in zip(stored["documents"], stored["metadatas"])])
+        return
+    # Rebuilt, or the constitution snapshot was rewritten: everything holding the old collection goes
+    keys = [("vectorstore", name), ("keyword_index", name)]
+    keys += [("qa_chain", option) for option, names in SOURCE_COLLECTIONS.items() if name in names]
+    if name == CHAT_COLLECTION:
+        keys.append(("chat_writer", CHAT_COLLECTION))
+    registry.discard(*keys)
+
+def prepare_answer(question: str, source_option: str, memory: ConversationMemory = None):
+    """Returns (qa_chain, cached answer or None, packed docs, question embedding, cache partition, packing stats)."""
+    incr("questions")
+    sync_external_ingestion()
+    qa_chain = get_qa_chain(source_option)
+    answer, query_embedding, cache_partition = lookup_cached_answer(question, source_option, memory)
+    docs, context_stats = [], None
+    if answer is None:
+        docs, context_stats = pack_context(question, retrieve_context(qa_chain, question, source_option, query_embedding))
+    return qa_chain, answer, docs, query_embedding, cache_partition, context_stats
+
+def finish_answer(question: str, answer: str, query_embedding=None, cache_partition=None, cached=False,
+                  memory: ConversationMemory = None):
+    if not cached and cache_partition is not None:
+        get_registry().answer_cache().put(query_embedding, cache_partition, question, answer)
+    metadata = None
+    if memory is not None:
+        memory.add_turn(question, answer)
+        metadata = {"session": memory.session_id}
+    store_chat_interaction(get_vectorstore(CHAT_COLLECTION), question, answer, metadata)
+
+def new_memory(session_id=None) -> ConversationMemory:
+    summarizer = llm_summarizer(get_registry().llm()) if MEMORY_LLM_SUMMARY else None
+    return ConversationMemory(session_id, summarizer=summarizer)
+
+def get_memory(session_id: str) -> ConversationMemory:
+    return get_registry().get_or_create(("memories",), lambda: MemoryStore(factory=new_memory)).get(session_id)
+
+def recall_history(memory: ConversationMemory, question: str, query_embedding=None) -> str:
+    """Chat history for the prompt; turns older than the window are looked up in CHAT_COLLECTION only if there are any."""
+    if memory is None:
+        return ""
+    recalled = []
+    if memory.has_older_turns() and MEMORY_RECALL_K:
         try:
-            if suffix == ".pdf":
-                loader = PyMuPDFLoader(path)
-            elif suffix == ".txt":
-                loader = TextLoader(path)
-            elif suffix == ".docx":
-                loader = Docx2txtLoader(path)
-            else:
-                continue
-            docs.extend(loader.load())
-        finally:
-            os.remove(path)
+            with span("memory_recall"):
+                if query_embedding is None:
+                    query_embedding = get_registry().query_embeddings().embed_query(question)
+                docs = get_vectorstore(CHAT_COLLECTION).similarity_search_by_vector(
+                    query_embedding, k=MEMORY_RECALL_K, filter={"session": memory.session_id}
+                )
+            recalled = [doc.page_content for doc in docs if not memory.in_window(doc.page_content)]
+        except Exception as e:
+            print(f"Error recalling earlier turns: {e}")
+    return memory.render(recalled)
+
+def start_chat_compaction():
+    if CHAT_COMPACT_INTERVAL_HOURS <= 0:
+        return None
+    return get_registry().get_or_create(
+        ("chat_compactor",),
+        lambda: CompactionScheduler(
+            lambda: compact_chat_history(get_vectorstore(CHAT_COLLECTION), lock=get_chat_writer().lock),
+            interval=CHAT_COMPACT_INTERVAL_HOURS * 3600,
+            lock_path=COMPACTION_LOCK
+        )
+    )
+
+def read_uploaded_files(files) -> List[tuple]:
+    return [(file.name, file.getvalue() if hasattr(file, "getvalue") else file.read()) for file in files]
 
+def load_documents(files, progress=None) -> List[Document]:
+    docs = []
+    for _, file_docs in parse_files(read_uploaded_files(files), get_registry().parse_executor(), progress):
+        docs.extend(file_docs)
     return docs
 
 def process_documents(docs: List[Document]) -> List[Document]:
     for doc in docs:
         if not hasattr(doc, "metadata") or doc.metadata is None:
             doc.metadata = {}
-    return docs
+    return chunk_documents(docs, get_registry().text_splitter())
 
 def process_constitution_text(text):
-    text = text.replace('\r\n', '\n').replace('\r', '\n')
-    text = re.sub(r'\n{2,}', '\n\n', text)
-    
-    print(f"Normalized text (first 500 chars): {text[:500]}")
-
-    patterns = [
-        r'Article\s+(\d+)[.\s]*(.*?)(?=\s*Article\s+\d+|$)',
-        r'Article\s+(\d+)[.\s]*\n*(.*?)(?=\n\n|$)',
-        r'Article\s+(\d+)[.\s]*\n*([^\n]*)(?=\n|$)',
-        r'Article\s*(\d+)\s*\.\s*(.*?)(?=\s*Article\s+\d+|$)',
-        r'Article\s*(\d+)\s*[\n\s]*(.*?)(?=\s*Article\s+\d+|$)',
-        r'Article\s+(\d+)\s*[:\s]*(.*?)(?=\s*Article\s+\d+|$)',
-    ]
-
-    processed_docs = []
-    found_articles = set()
-    
-    for pattern in patterns:
-        articles = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
-        for article_num, content in articles:
-            if int(article_num) not in found_articles:
-                cleaned_content = content.strip()
-                cleaned_content = re.sub(r'Note\.\s+.*?(?=\n|$)', '', cleaned_content, flags=re.DOTALL)
-                cleaned_content = re.sub(r'\s+', ' ', cleaned_content).strip()
-                doc = Document(
-                    page_content=f"Article {article_num}. {cleaned_content}",
-                    metadata={"source": "Constitution", "article": int(article_num)}
-                )
-                processed_docs.append(doc)
-                found_articles.add(int(article_num))
-                if int(article_num) == 93:
-                    print(f"Extracted content for Article 93: {cleaned_content[:200]}...")
-
-    if len(found_articles) < 99:
-        print(f"Regex found {len(found_articles)} articles, falling back to position-based extraction")
-        article_markers = list(re.finditer(r'Article\s+(\d+)', text, re.IGNORECASE))
-        if article_markers:
-            positions = [(int(m.group(1)), m.start()) for m in article_markers]
-            positions.sort(key=lambda x: x[0])
-            
-            for i, (article_num, start_pos) in enumerate(positions):
-                if article_num in found_articles:
-                    continue
-                if i < len(positions) - 1:
-                    end_pos = positions[i + 1][1]
-                    content = text[start_pos:end_pos].strip()
-                else:
-                    content = text[start_pos:].strip()
-                
-                content = re.sub(r'Article\s+\d+\s*[\.\s:]*', '', content, 1, re.IGNORECASE)
-                content = re.sub(r'Note\.\s+.*?(?=\n|$)', '', content, flags=re.DOTALL)
-                content = re.sub(r'\s+', ' ', content).strip()
-                
-                if content:
-                    doc = Document(
-                        page_content=f"Article {article_num}. {content}",
-                        metadata={"source": "Constitution", "article": article_num}
-                    )
-                    processed_docs.append(doc)
-                    found_articles.add(article_num)
-                    if article_num == 93:
-                        print(f"Position-based extracted content for Article 93: {content[:200]}...")
-                else:
-                    print(f"Empty content for Article {article_num}, skipping")
-
-    processed_docs.sort(key=lambda x: x.metadata["article"])
+    # Pages are streamed into the segmenter, so for a PDF this span includes reading the pages
+    with span("segment"):
+        processed_docs = segment_articles(text)
+    incr("articles_segmented", len(processed_docs))
 
-    found_nums = [doc.metadata["article"] for doc in processed_docs]
+    found_nums = {doc.metadata["article"] for doc in processed_docs}
     missing = [i for i in range(1, 100) if i not in found_nums]
     print(f"Extracted {len(found_nums)} articles. Missing articles: {missing}")
 
-    if missing:
-        for missing_article in missing:
-            snippet_start = text.find(f"Article {missing_article}")
-            if snippet_start != -1:
-                snippet = text[max(0, snippet_start-100):snippet_start+100]
-                print(f"Raw text around missing Article {missing_article}: {snippet}")
-            else:
-                marker_positions = [m.start() for m in re.finditer(r'Article\s+\d+', text, re.IGNORECASE)]
-                for pos in marker_positions:
-                    if abs(pos - text.find(str(missing_article))) < 200:
-                        snippet = text[max(0, pos-100):pos+100]
-                        print(f"Raw text near Article {missing_article}: {snippet}")
-
-    with open("extracted_articles.txt", "w", encoding="utf-8") as f:
-        for doc in processed_docs:
-            f.write(f"{doc.page_content}\n\n")
+    if DEBUG_LEVEL >= 2:
+        with open("extracted_articles.txt", "w", encoding="utf-8") as f:
+            for doc in processed_docs:
+                f.write(f"{doc.page_content}\n\n")
 
     return processed_docs
 
-def load_constitution_from_file():
-    constitution_path = "data/akorda.kz-Constitution of the Republic of Kazakhstan.pdf"
+def clean_constitution_page(text):
+    text = text.replace('\f', '\n')
+    text = re.sub(r'Constitution of Kazakhstan\s*\d+', '', text)
+    text = re.sub(r'^[ \t]*\d+(?:/\d+)?[ \t]*$', '', text, flags=re.MULTILINE)
+    return text + "\n"
+
+def load_constitution_from_file(constitution_path=CONSTITUTION_PATH):
+    with span("load"):
+        return _load_constitution_from_file(constitution_path)
+
+def _load_constitution_from_file(constitution_path):
     if not os.path.exists(constitution_path):
         print(f"Constitution file not found at {constitution_path}")
         return []
 
     try:
         loader = PyMuPDFLoader(constitution_path)
-        docs = loader.load()
-        full_text = "\n".join(doc.page_content for doc in docs)
-        full_text = re.sub(r'\s+', ' ', full_text)
-        full_text = re.sub(r'-\n', '', full_text)
-        full_text = re.sub(r'\n+', '\n', full_text)
-        full_text = re.sub(r'\f', '\n', full_text)
-        full_text = re.sub(r'Constitution of Kazakhstan\s*\d+', '', full_text)
-        full_text = re.sub(r'^\d+\s*$', '', full_text, flags=re.MULTILINE)
-        article_count = len(re.findall(r'Article\s+\d+', full_text, re.IGNORECASE))
-        print(f"PyMuPDFLoader found {article_count} article mentions")
+        pages = (clean_constitution_page(doc.page_content) for doc in loader.lazy_load())
+        processed_docs = process_constitution_text(pages)
+        print(f"PyMuPDFLoader found {len(processed_docs)} articles")
     except Exception as e:
         print(f"PyMuPDFLoader failed: {e}")
-        full_text = ""
-        article_count = 0
+        processed_docs = []
 
-    if article_count < 90:
-        print(f"PyMuPDFLoader only found {article_count} articles. Trying UnstructuredPDFLoader...")
+    if len(processed_docs) < 90:
+        print(f"PyMuPDFLoader only found {len(processed_docs)} articles. Trying UnstructuredPDFLoader...")
         try:
             loader = UnstructuredPDFLoader(constitution_path, strategy="hi_res")
-            docs = loader.load()
-            full_text = "\n".join(doc.page_content for doc in docs)
-            full_text = re.sub(r'\s+', ' ', full_text)
-            full_text = re.sub(r'-\n', '', full_text)
-            full_text = re.sub(r'\n+', '\n', full_text)
-            full_text = re.sub(r'\f', '\n', full_text)
-            full_text = re.sub(r'Constitution of Kazakhstan\s*\d+', '', full_text)
-            full_text = re.sub(r'^\d+\s*$', '', full_text, flags=re.MULTILINE)
-            article_count = len(re.findall(r'Article\s+\d+', full_text, re.IGNORECASE))
-            print(f"UnstructuredPDFLoader found {article_count} article mentions")
-            print(f"Text around Article 93: {full_text[full_text.find('Article 93')-100:full_text.find('Article 93')+100] if 'Article 93' in full_text else 'Article 93 not found'}")
+            pages = (clean_constitution_page(doc.page_content) for doc in loader.lazy_load())
+            processed_docs = process_constitution_text(pages)
+            print(f"UnstructuredPDFLoader found {len(processed_docs)} articles")
         except Exception as e:
             print(f"UnstructuredPDFLoader failed: {e}")
             return []
 
-    print(f"Full extracted text (first 2000 chars):\n{full_text[:2000]}")
-
-    processed_docs = process_constitution_text(full_text)
-    
     article_nums = [doc.metadata["article"] for doc in processed_docs]
     print(f"Found {len(article_nums)} articles with proper metadata")
     if len(article_nums) < 95:
@@ -274,95 +470,174 @@ def load_constitution_from_file():
 
     return processed_docs
 
+def ensure_constitution_loaded() -> int:
+    """Embed the bundled constitution PDF unless it is already in the vectorstore; returns documents loaded."""
+    registry = get_registry()
+    vectorstore = get_vectorstore(CONSTITUTION_COLLECTION)
+    try:
+        manifest = registry.manifest()
+        with open(CONSTITUTION_PATH, "rb") as f:
+            constitution_hash = content_hash(f.read())
+        count = collection_count(vectorstore)
+        built_from = getattr(vectorstore, "info", {}).get("source_sha256")
+        if count and (manifest.has_file(CONSTITUTION_COLLECTION, constitution_hash)
+                      or built_from == constitution_hash
+                      or not manifest.chunks.get(CONSTITUTION_COLLECTION)):
+            print(f"Constitution vectorstore already has {count} documents")
+            if not len(registry.article_index()):
+                rebuilt = registry.article_index().rebuild_from_vectorstore(vectorstore)
+                print(f"Rebuilt article index with {rebuilt} articles")
+            return 0
+
+        print("Loading constitution from file...")
+        const_docs = load_constitution_from_file()
+        valid_docs = []
+        for doc in const_docs:
+            if isinstance(doc, Document):
+                valid_docs.append(doc)
+            else:
+                print(f"Converting non-Document object to Document")
+                valid_docs.append(Document(page_content=str(doc)))
+
+        if valid_docs:
+            ingest_documents(vectorstore, CONSTITUTION_COLLECTION, valid_docs,
+                             manifest, source=CONSTITUTION_PATH, file_hash=constitution_hash,
+                             keyword_index=get_keyword_index(CONSTITUTION_COLLECTION))
+            registry.article_index().update(valid_docs)
+        return len(valid_docs)
+    except Exception as e:
+        print(f"Error checking constitution documents: {e}")
+        const_docs = load_constitution_from_file()
+        if const_docs:
+            try:
+                ingest_documents(vectorstore, CONSTITUTION_COLLECTION, const_docs,
+                                 registry.manifest(), source=CONSTITUTION_PATH,
+                                 keyword_index=get_keyword_index(CONSTITUTION_COLLECTION))
+                registry.article_index().update(const_docs)
+                return len(const_docs)
+            except Exception as add_error:
+                print(f"Error adding constitution documents: {add_error}")
+        return 0
+
+def ingest_constitution_text(text: str):
+    """Returns (articles processed, new or changed), or None if this exact text is already loaded."""
+    registry = get_registry()
+    text_hash = content_hash(text)
+    if registry.manifest().has_file(CONSTITUTION_COLLECTION, text_hash):
+        return None
+    docs = process_constitution_text(text)
+    added = ingest_documents(get_vectorstore(CONSTITUTION_COLLECTION), CONSTITUTION_COLLECTION, docs,
+                             registry.manifest(), file_hash=text_hash, name="pasted text",
+                             keyword_index=get_keyword_index(CONSTITUTION_COLLECTION))
+    registry.article_index().update(docs)
+    return len(docs), added
+
+def ingest_files(files: List[tuple], progress=None, replace_sources: bool = False, executor=None,
+                 batch_size: int = EMBED_BATCH_SIZE):
+    """Parse, chunk and embed (name, bytes) pairs into the uploads collection; returns (new or changed chunks, skipped names).
+
+    Uploads are keyed by content, so files that only share a name are kept side by side. With
+    `replace_sources` (bulk_ingest.py, whose names are paths) a file replaces the earlier version
+    ingested under the same name. `executor` overrides the app's parse worker pool. The manifest
+    is saved once at the end, also when a file fails, so a failed call re-embeds at most its own files.
+    """
+    registry = get_registry()
+    manifest = registry.manifest()
+    if manifest.files.get(UPLOADS_COLLECTION) and collection_count(get_vectorstore(UPLOADS_COLLECTION)) == 0:
+        print(f"Collection {UPLOADS_COLLECTION} is empty, discarding its manifest entries")
+        manifest.forget_collection(UPLOADS_COLLECTION)
+        manifest.save()
+    pending, hashes, skipped = [], {}, []
+    for name, data in files:
+        file_hash = content_hash(data)
+        if manifest.has_file(UPLOADS_COLLECTION, file_hash):
+            skipped.append(name)
+        else:
+            pending.append((name, data))
+            hashes[name] = file_hash
+
+    added = 0
+    try:
+        for name, raw_docs in parse_files(pending, executor or registry.parse_executor(), progress):
+            if not replace_sources:
+                for doc in raw_docs:
+                    doc.metadata["file_hash"] = hashes[name]
+            processed_docs = process_documents(raw_docs)
+            added += ingest_documents(get_vectorstore(UPLOADS_COLLECTION), UPLOADS_COLLECTION, processed_docs,
+                                      manifest, source=name if replace_sources else None, file_hash=hashes[name],
+                                      name=name, batch_size=batch_size, progress=progress,
+                                      keyword_index=get_keyword_index(UPLOADS_COLLECTION), save=False)
+    finally:
+        if pending:
+            manifest.save()
+    return added, skipped
+
 def main():
     st.set_page_config(page_title="Kazakhstan Constitution Assistant", layout="wide")
     st.title("Constitution & Document AI Assistant")
 
+    registry = get_registry()
     if "embeddings" not in st.session_state:
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-        model = model.to("cpu")
-        st.session_state.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-            model_kwargs={"device": "cpu"}
-        )
-        
-    try:
-        if os.path.exists(DB_DIR):
-            try:
-                client = chromadb.PersistentClient(path=DB_DIR)
-                collections = client.list_collections()
-                print(f"Found {len(collections)} existing collections")
-            except Exception as e:
-                print(f"Error accessing vectorstore, attempting cleanup: {e}")
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_dir = f"{DB_DIR}_backup_{timestamp}"
-                shutil.move(DB_DIR, backup_dir)
-                print(f"Moved corrupted vectorstore to {backup_dir}")
-                os.makedirs(DB_DIR, exist_ok=True)
-    except Exception as e:
-        print(f"Error during vectorstore cleanup: {e}")
+        st.session_state.embeddings = registry.embeddings()
         
+    if "vectorstore_checked" not in st.session_state:
+        check_vectorstore()
+        st.session_state.vectorstore_checked = True
+
+
     if "constitution_vectorstore" not in st.session_state:
-        st.session_state.constitution_vectorstore = initialize_vectorstore(st.session_state.embeddings, CONSTITUTION_COLLECTION)
-        
-        try:
-            docs = st.session_state.constitution_vectorstore.get()
-            if isinstance(docs, dict) and "documents" in docs and len(docs["documents"]) > 0:
-                print(f"Constitution vectorstore already has {len(docs['documents'])} documents")
-            else:
-                print("Loading constitution from file...")
-                const_docs = load_constitution_from_file()
-                if const_docs:
-                    valid_docs = []
-                    for doc in const_docs:
-                        if isinstance(doc, Document):
-                            valid_docs.append(doc)
-                        else:
-                            print(f"Converting non-Document object to Document")
-                            valid_docs.append(Document(page_content=str(doc)))
-                    
-                    if valid_docs:
-                        st.session_state.constitution_vectorstore.add_documents(valid_docs)
-                        st.sidebar.success(f"Constitution loaded from PDF file: {len(valid_docs)} documents")
-        except Exception as e:
-            print(f"Error checking constitution documents: {e}")
-            const_docs = load_constitution_from_file()
-            if const_docs:
-                try:
-                    st.session_state.constitution_vectorstore.add_documents(const_docs)
-                    st.sidebar.success("Constitution loaded from PDF file")
-                except Exception as add_error:
-                    print(f"Error adding constitution documents: {add_error}")
-            
+        st.session_state.constitution_vectorstore = get_vectorstore(CONSTITUTION_COLLECTION)
+        loaded = ensure_constitution_loaded()
+        if loaded:
+            st.sidebar.success(f"Constitution loaded from PDF file: {loaded} documents")
+
     if "chat_vectorstore" not in st.session_state:
-        st.session_state.chat_vectorstore = initialize_vectorstore(st.session_state.embeddings, CHAT_COLLECTION)
+        st.session_state.chat_vectorstore = get_vectorstore(CHAT_COLLECTION)
     if "uploaded_vectorstore" not in st.session_state:
-        st.session_state.uploaded_vectorstore = initialize_vectorstore(st.session_state.embeddings, UPLOADS_COLLECTION)
+        st.session_state.uploaded_vectorstore = get_vectorstore(UPLOADS_COLLECTION)
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    if "memory" not in st.session_state:
+        st.session_state.memory = new_memory()
+    start_chat_compaction()
 
     st.sidebar.header("Load Constitution")
     constitution_text = st.sidebar.text_area("Paste Constitution Text", height=300)
     if st.sidebar.button("Process Constitution"):
         if constitution_text:
-            docs = process_constitution_text(constitution_text)
-            st.session_state.constitution_vectorstore.add_documents(docs)
-            st.success(f"Constitution loaded and embedded! {len(docs)} articles processed.")
+            result = ingest_constitution_text(constitution_text)
+            if result is None:
+                st.info("This constitution text is already loaded.")
+            else:
+                processed, added = result
+                st.success(f"Constitution loaded and embedded! {processed} articles processed, {added} new or changed.")
 
     st.sidebar.header("Upload Documents")
     uploaded_files = st.sidebar.file_uploader("Upload files", accept_multiple_files=True, type=["pdf", "txt", "docx"])
     if st.sidebar.button("Process Files"):
         if uploaded_files:
             with st.spinner("Processing uploaded files..."):
-                raw_docs = load_documents(uploaded_files)
-                processed_docs = process_documents(raw_docs)
-                st.session_state.uploaded_vectorstore.add_documents(processed_docs)
-                st.success("Files processed and embedded!")
+                progress_bar = st.progress(0.0, text="Parsing uploaded files...")
+
+                def report(stage, done, total):
+                    progress_bar.progress(min(done / total, 1.0) if total else 1.0, text=f"{stage}: {done}/{total}")
+
+                added, skipped = ingest_files(read_uploaded_files(uploaded_files), report)
+                progress_bar.empty()
+                st.success(f"Files processed and embedded! {added} new or changed chunks.")
+                if skipped:
+                    st.info(f"Already loaded, skipped: {', '.join(skipped)}")
         else:
             st.warning("Please upload at least one document.")
 
     source_option = st.sidebar.radio("Answer questions using:", ["Constitution", "Uploaded Documents", "Both"])
+    stream_answers = st.sidebar.checkbox("Stream answers", value=STREAM_ANSWERS)
+    if registry.answer_cache() is not None:
+        cache_stats = registry.answer_cache().stats()
+        st.sidebar.caption(f"Answer cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if tracer.enabled:
+        with st.sidebar.expander("Latency metrics"):
+            st.json(tracer.snapshot())
 
     for msg in st.session_state.chat_history:
         with st.chat_message(msg["role"]):
@@ -374,73 +649,33 @@ def main():
             st.write(question)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    llm = Ollama(model="mistral")
-                    prompt = PromptTemplate(input_variables=["chat_history", "context", "question"], template=CUSTOM_PROMPT)
-
-                    article_match = re.search(r'article\s+(\d+)', question.lower())
-                    article_num = int(article_match.group(1)) if article_match else None
-
-                    if source_option == "Constitution":
-                        vectorstore = st.session_state.constitution_vectorstore
-                    elif source_option == "Uploaded Documents":
-                        vectorstore = st.session_state.uploaded_vectorstore
-                    else:
-                        const_retriever = st.session_state.constitution_vectorstore.as_retriever(search_kwargs={"k": 3})
-                        uploaded_retriever = st.session_state.uploaded_vectorstore.as_retriever(search_kwargs={"k": 2})
-                        from langchain.retrievers import MergerRetriever
-                        vectorstore = None
-                        retriever = MergerRetriever(retrievers=[const_retriever, uploaded_retriever])
-
-                    if source_option in ["Constitution", "Both"]:
-                        if article_num and vectorstore:
-                            try:
-                                retriever = vectorstore.as_retriever(
-                                    search_type="similarity",
-                                    search_kwargs={"k": 5, "filter": {"article": article_num}}
-                                )
-                                retrieved_docs = retriever.get_relevant_documents(question)
-                                if not retrieved_docs:
-                                    print(f"No documents found for Article {article_num} using metadata filter. Falling back to similarity search.")
-                                    retriever = vectorstore.as_retriever(search_kwargs={"k": 10})
-                                    retrieved_docs = retriever.get_relevant_documents(f"Article {article_num}")
-                                    retrieved_docs = [doc for doc in retrieved_docs if f"Article {article_num}" in doc.page_content]
-                                    if not retrieved_docs:
-                                        print(f"No documents found for Article {article_num} even after content search.")
-                            except Exception as e:
-                                print(f"Error with metadata filter for Article {article_num}: {e}")
-                                retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-                                retrieved_docs = retriever.get_relevant_documents(question)
-                        else:
-                            retriever = vectorstore.as_retriever(search_kwargs={"k": 5}) if vectorstore else retriever
-                    else:
-                        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-
-                    if article_num:
-                        retrieved_docs = retriever.get_relevant_documents(question)
-                        print(f"Retrieved {len(retrieved_docs)} documents for Article {article_num} query")
-                        for i, doc in enumerate(retrieved_docs):
-                            print(f"Doc {i+1} - Article in metadata: {doc.metadata.get('article')}")
-                            print(f"Doc {i+1} - Full content: {doc.page_content}")
-
-                    chain = ConversationalRetrievalChain.from_llm(
-                        llm=llm,
-                        retriever=retriever,
-                        memory=ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer"),
-                        combine_docs_chain_kwargs={"prompt": prompt}
-                    )
-
-                    response = chain({"question": question})
-                    answer = response["answer"]
+            try:
+                with st.spinner("Thinking..."):
+                    qa_chain, answer, docs, query_embedding, cache_partition, context_stats = prepare_answer(
+                        question, source_option, st.session_state.memory)
+                    cached = answer is not None
+                    if not cached:
+                        chat_history = recall_history(st.session_state.memory, question, query_embedding)
+                if cached:
                     st.write(answer)
-
-                    store_chat_interaction(st.session_state.chat_vectorstore, question, answer)
-                    st.session_state.chat_history.append({"role": "assistant", "content": answer})
-                except Exception as e:
-                    error = f"Error: {e}"
-                    st.error(error)
-                    st.session_state.chat_history.append({"role": "assistant", "content": error})
+                    st.caption("Answered from cache")
+                else:
+                    if stream_answers:
+                        answer = st.write_stream(qa_chain.stream(question, docs, chat_history))
+                    else:
+                        with st.spinner("Thinking..."):
+                            answer = qa_chain.run(question, docs, chat_history)
+                        st.write(answer)
+                    if context_stats:
+                        st.caption(f"Context: {context_stats['tokens_after']} prompt tokens, "
+                                   f"{context_stats['tokens_saved']} saved")
+
+                finish_answer(question, answer, query_embedding, cache_partition, cached, st.session_state.memory)
+                st.session_state.chat_history.append({"role": "assistant", "content": answer})
+            except Exception as e:
+                error = f"Error: {e}"
+                st.error(error)
+                st.session_state.chat_history.append({"role": "assistant", "content": error})
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
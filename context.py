@@ -0,0 +1,144 @@
+import re
+from typing import Iterable, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+
+from hybrid import tokenize
+from settings import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD, CONTEXT_TRIM_SENTENCES
+
+# Rough size of a Mistral token on English legal text; only used to budget, never to truncate mid-word
+CHARS_PER_TOKEN = 4
+_SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+(?=[A-Z0-9"(])')
+_WHITESPACE = re.compile(r'\s+')
+# Fragments that only number what follows ("Article 5.", "2.", "3-1.") are joined to the next sentence
+_NUMBERING = re.compile(r'^(?:Article\s+)?\d+(?:-\d+)?\.$')
+
+
+def count_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences, prefix = [], ""
+    for part in _SENTENCE_END.split(_WHITESPACE.sub(" ", text).strip()):
+        if _NUMBERING.match(part):
+            prefix += part + " "
+            continue
+        if part:
+            sentences.append(prefix + part)
+            prefix = ""
+    if prefix:
+        sentences.append(prefix.strip())
+    return sentences
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WHITESPACE.sub(" ", text.lower()).split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextPacker:
+    """Fits retrieved documents into a prompt token budget before they reach the LLM.
+
+    Duplicate and near-duplicate chunks (same article from two retrievers,
+    overlapping upload chunks) are dropped, the rest are ranked by retrieval
+    order and overlap with the question, long chunks are cut down to the
+    sentences that mention question terms, and chunks are added best first
+    until the budget is spent. Documents listed in `pinned` (articles the
+    question names) go first and are never trimmed, only cut at the budget.
+    """
+
+    def __init__(self, budget_tokens: int = CONTEXT_TOKEN_BUDGET, dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+                 trim_sentences: bool = CONTEXT_TRIM_SENTENCES):
+        self.budget_tokens = budget_tokens
+        self.dedup_threshold = dedup_threshold
+        self.trim_sentences = trim_sentences
+
+    def pack(self, question: str, docs: List[Document], pinned: Iterable[int] = ()) -> Tuple[List[Document], dict]:
+        tokens_before = count_tokens("\n\n".join(doc.page_content for doc in docs))
+        unique = self.deduplicate(docs)
+        terms = set(tokenize(question))
+        pinned = set(pinned)
+
+        ranked = sorted(
+            enumerate(unique),
+            key=lambda item: (
+                (item[1].metadata or {}).get("article") not in pinned,
+                -self._score(item[1].page_content, terms, item[0]),
+            )
+        )
+
+        packed, used = [], 0
+        for _, doc in ranked:
+            is_pinned = (doc.metadata or {}).get("article") in pinned
+            text = doc.page_content if is_pinned or not self.trim_sentences else self.trim(doc.page_content, terms)
+            remaining = self.budget_tokens - used
+            if remaining <= 0:
+                break
+            if count_tokens(text) > remaining:
+                fitted = self._fit(text, remaining)
+                if not fitted and not is_pinned:
+                    continue
+                # A named article always contributes at least its opening sentence
+                text = fitted or split_sentences(text)[0]
+            packed.append(Document(page_content=text, metadata=doc.metadata))
+            used += count_tokens(text) + 1
+
+        tokens_after = count_tokens("\n\n".join(doc.page_content for doc in packed))
+        return packed, {
+            "docs_in": len(docs),
+            "docs_out": len(packed),
+            "duplicates": len(docs) - len(unique),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": max(0, tokens_before - tokens_after),
+        }
+
+    def deduplicate(self, docs: List[Document]) -> List[Document]:
+        kept: List[Tuple[str, Set[Tuple[str, ...]], Document]] = []
+        for doc in docs:
+            normalized = _WHITESPACE.sub(" ", doc.page_content.lower()).strip()
+            shingles = _shingles(normalized)
+            duplicate = False
+            for other, other_shingles, _ in kept:
+                # A chunk contained in a better-ranked one (or containing it) adds little but length
+                if normalized in other or other in normalized:
+                    duplicate = True
+                    break
+                overlap = len(shingles & other_shingles) / max(1, min(len(shingles), len(other_shingles)))
+                if overlap >= self.dedup_threshold:
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append((normalized, shingles, doc))
+        return [doc for _, _, doc in kept]
+
+    def trim(self, text: str, terms: Set[str]) -> str:
+        sentences = split_sentences(text)
+        if len(sentences) <= 2 or not terms:
+            return text
+        # Keep the first sentence (usually the article or section heading) and every sentence naming a question term
+        keep = [0] + [i for i, sentence in enumerate(sentences[1:], 1) if terms & set(tokenize(sentence))]
+        if len(keep) == 1:
+            return text
+        return " ".join(sentences[i] for i in keep)
+
+    @staticmethod
+    def _score(text: str, terms: Set[str], rank: int) -> float:
+        words = set(tokenize(text))
+        overlap = len(terms & words) / len(terms) if terms else 0.0
+        # Retrieval order still counts: it already reflects dense and keyword relevance
+        return overlap + 1.0 / (rank + 2)
+
+    @staticmethod
+    def _fit(text: str, budget: int) -> Optional[str]:
+        kept, used = [], 0
+        for sentence in split_sentences(text):
+            cost = count_tokens(sentence) + 1
+            if used + cost > budget:
+                break
+            kept.append(sentence)
+            used += cost
+        return " ".join(kept) if kept else None
@@ -0,0 +1,187 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from tracing import span
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall that the their this to was were "
+    "which who will with what does do how".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class KeywordIndex:
+    """Incremental in-memory BM25 index over one Chroma collection.
+
+    Built lazily from the collection on first search; after that ingestion
+    keeps it current through upsert()/delete(). Updates that arrive before the
+    first build are dropped, since the build reads them from Chroma anyway.
+    """
+
+    def __init__(self, loader: Callable[[], Tuple[List[str], List[str], List[dict]]],
+                 k1: float = 1.5, b: float = 0.75):
+        self.loader = loader
+        self.k1 = k1
+        self.b = b
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._docs: Dict[str, Document] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            ids, texts, metadatas = self.loader()
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                self._add(doc_id, Document(page_content=text or "", metadata=metadata or {}))
+            self.loaded = True
+            print(f"Built keyword index with {len(self._docs)} documents")
+
+    def upsert(self, ids: Sequence[str], docs: Sequence[Document]):
+        if not self.loaded:
+            return
+        with self._lock:
+            for doc_id, doc in zip(ids, docs):
+                self._remove(doc_id)
+                self._add(doc_id, doc)
+
+    def delete(self, ids: Iterable[str]):
+        if not self.loaded:
+            return
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def search(self, query: str, k: int) -> List[Document]:
+        self.ensure_loaded()
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [self._docs[doc_id] for doc_id, _ in best]
+
+    def _add(self, doc_id: str, doc: Document):
+        counts = Counter(tokenize(doc.page_content))
+        self._docs[doc_id] = doc
+        self._lengths[doc_id] = sum(counts.values())
+        self._total_length += self._lengths[doc_id]
+        for term, tf in counts.items():
+            self._postings[term][doc_id] = tf
+
+    def _remove(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in set(tokenize(doc.page_content)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+
+def collection_loader(vectorstore) -> Callable[[], Tuple[List[str], List[str], List[dict]]]:
+    def load():
+        stored = vectorstore.get(include=["documents", "metadatas"])
+        return stored.get("ids") or [], stored.get("documents") or [], stored.get("metadatas") or []
+    return load
+
+
+def _doc_key(doc: Document) -> str:
+    metadata = doc.metadata or {}
+    return hashlib.sha1(f"{metadata.get('source', '')}\0{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    scores: Dict[str, float] = defaultdict(float)
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = _doc_key(doc)
+            scores[key] += 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [docs[key] for key, _ in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense + BM25 retrieval over one or more collections, fused with reciprocal-rank fusion.
+
+    The query is embedded once; every dense search and keyword search then
+    runs concurrently on a shared thread pool, so latency tracks the slowest
+    single search rather than their sum.
+    """
+
+    sources: List[Any]
+    embeddings: Any
+    executor: Any = None
+    k: int = 5
+    fetch_k: int = 10
+
+    def retrieve(self, query: str, query_embedding: Optional[List[float]] = None) -> List[Document]:
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = self.embeddings.embed_query(query)
+
+        tasks = []
+        for vectorstore, keyword_index in self.sources:
+            tasks.append(("vector_search", vectorstore.similarity_search_by_vector, (query_embedding, self.fetch_k)))
+            if keyword_index is not None:
+                tasks.append(("keyword_search", keyword_index.search, (query, self.fetch_k)))
+
+        if self.executor is None or len(tasks) < 2:
+            rankings = [self._safe(*task) for task in tasks]
+        else:
+            futures = [self.executor.submit(self._safe, *task) for task in tasks]
+            rankings = [future.result() for future in futures]
+        return reciprocal_rank_fusion(rankings, self.k)
+
+    @staticmethod
+    def _safe(name, fn, args) -> List[Document]:
+        try:
+            with span(name):
+                return fn(*args)
+        except Exception as e:
+            print(f"Retrieval source failed: {e}")
+            return []
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.retrieve(query)
+
+
+def retrieval_executor(max_workers: int = 8) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
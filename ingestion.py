@@ -0,0 +1,428 @@
+import copy
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain.schema import Document
+
+from settings import DB_DIR, EMBED_BATCH_SIZE, PDF_PAGES_PER_TASK
+from tracing import span, record, incr
+
+MANIFEST_FILE = "ingestion_manifest.json"
+SUPPORTED_SUFFIXES = (".pdf", ".txt", ".docx")
+
+# progress(stage, done, total)
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def parse_file(name: str, data: bytes, first_page: int = 0, last_page: Optional[int] = None) -> List[Document]:
+    """Parse an in-memory file into page (PDF) or whole-file (TXT/DOCX) documents.
+
+    Module-level so it can run in a worker process; PDFs can be parsed in page
+    ranges to spread one large file over several workers.
+    """
+    suffix = Path(name).suffix.lower()
+    if suffix == ".pdf":
+        import fitz
+        docs = []
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            last_page = pdf.page_count if last_page is None else min(last_page, pdf.page_count)
+            for page_num in range(first_page, last_page):
+                text = pdf[page_num].get_text()
+                if text.strip():
+                    docs.append(Document(
+                        page_content=text,
+                        metadata={"source": name, "page": page_num, "total_pages": pdf.page_count}
+                    ))
+        return docs
+    if suffix == ".docx":
+        import docx2txt
+        text = docx2txt.process(io.BytesIO(data))
+    elif suffix == ".txt":
+        text = data.decode("utf-8", errors="replace")
+    else:
+        return []
+    return [Document(page_content=text, metadata={"source": name})] if text.strip() else []
+
+
+def _parse_tasks(name: str, data: bytes) -> List[Tuple[str, bytes, int, Optional[int]]]:
+    if Path(name).suffix.lower() != ".pdf":
+        return [(name, data, 0, None)]
+    import fitz
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        page_count = pdf.page_count
+    return [(name, data, start, start + PDF_PAGES_PER_TASK) for start in range(0, page_count, PDF_PAGES_PER_TASK)] or [(name, data, 0, None)]
+
+
+def parse_files(files: List[Tuple[str, bytes]], executor=None,
+                progress: Optional[ProgressCallback] = None) -> Iterator[Tuple[str, List[Document]]]:
+    """Parse (name, bytes) pairs, yielding (name, documents) as each file completes.
+
+    With an executor, work is sharded across it (PDFs by page range) so files
+    are parsed concurrently and the caller can start embedding the first file
+    while the rest are still being parsed.
+    """
+    files = [(name, data) for name, data in files if Path(name).suffix.lower() in SUPPORTED_SUFFIXES]
+    tasks = [task for name, data in files for task in _parse_tasks(name, data)]
+    if executor is None or len(tasks) < 2:
+        for i, (name, data) in enumerate(files):
+            with span("parse", file=name):
+                docs = parse_file(name, data)
+            incr("documents_parsed", len(docs))
+            yield name, docs
+            if progress:
+                progress("Parsing", i + 1, len(files))
+        return
+
+    start = time.perf_counter()
+    futures = {executor.submit(parse_file, *task): task for task in tasks}
+    remaining = {name: 0 for name, _ in files}
+    for task in tasks:
+        remaining[task[0]] += 1
+    parts: Dict[str, List[Tuple[int, List[Document]]]] = {name: [] for name, _ in files}
+    done = 0
+    for future in as_completed(futures):
+        name, _, first_page, _ = futures[future]
+        try:
+            parts[name].append((first_page, future.result()))
+        except Exception as e:
+            print(f"Error parsing {name} from page {first_page}: {e}")
+        done += 1
+        if progress:
+            progress("Parsing", done, len(tasks))
+        remaining[name] -= 1
+        if remaining[name] == 0:
+            # Wall time from submission until the file's last part finished
+            record("parse", time.perf_counter() - start, file=name)
+            docs = [doc for _, docs in sorted(parts.pop(name), key=lambda p: p[0]) for doc in docs]
+            incr("documents_parsed", len(docs))
+            yield name, docs
+
+
+def chunk_documents(docs: List[Document], splitter) -> List[Document]:
+    chunks = []
+    for doc in docs:
+        for i, text in enumerate(splitter.split_text(doc.page_content)):
+            chunks.append(Document(page_content=text, metadata={**doc.metadata, "chunk": i}))
+    return chunks
+
+
+def content_hash(data: Union[bytes, str]) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_id(collection_name: str, doc: Document, index: int) -> str:
+    """Stable ID for a chunk, derived from where it sits rather than what it says.
+
+    Re-ingesting a changed source therefore upserts over its old chunks instead
+    of adding new ones next to them.
+    """
+    metadata = doc.metadata or {}
+    if metadata.get("article") is not None:
+        key = f"article:{metadata['article']}"
+    elif metadata.get("file_hash"):
+        # Browser uploads are keyed by content, so two users' different report.pdf files do not overwrite each other
+        key = f"file:{metadata['file_hash']}:{metadata.get('page', '')}:{metadata.get('chunk', index)}"
+    else:
+        key = f"{metadata.get('source', '')}:{metadata.get('page', '')}:{metadata.get('chunk', index)}"
+    return hashlib.sha1(f"{collection_name}:{key}".encode("utf-8")).hexdigest()
+
+
+def collection_count(vectorstore) -> int:
+    if hasattr(vectorstore, "count"):
+        return vectorstore.count()
+    try:
+        return vectorstore._collection.count()
+    except Exception as e:
+        print(f"Error counting collection documents: {e}")
+        return 0
+
+
+class IngestionManifest:
+    """Persistent record of ingested files and chunks, keyed by content hash.
+
+    files:   collection -> file hash -> {"name", "chunks", "ingested_at"}
+    chunks:  collection -> chunk id -> chunk content hash
+    sources: collection -> source name -> chunk ids last ingested from it
+    versions: collection -> counter bumped whenever its content changes
+
+    The app and bulk_ingest.py can write it at the same time. Each save merges
+    what the other process saved since our last read, under a file lock where
+    fcntl is available, so neither overwrites the other's entries.
+    """
+
+    _FIELDS = ("files", "chunks", "sources")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(DB_DIR, MANIFEST_FILE)
+        self._lock = threading.RLock()
+        self.files: Dict[str, Dict[str, dict]] = {}
+        self.chunks: Dict[str, Dict[str, str]] = {}
+        self.sources: Dict[str, Dict[str, List[str]]] = {}
+        self.versions: Dict[str, int] = {}
+        # Collections another process changed since the last pop_external_changes():
+        # name -> {"changed": chunk ids added or re-embedded, "removed": chunk ids deleted}
+        self.external_changes: Dict[str, dict] = {}
+        # The file as we last read or wrote it, to tell our changes from the other process's
+        self._base = {"files": {}, "chunks": {}, "sources": {}, "versions": {}}
+        self._stamp = None
+        self._last_pop = None
+        self.load()
+
+    def _read(self):
+        """(stamp, data) of the file on disk, or None; the stamp changes with every save since saves replace the file."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stat = os.fstat(f.fileno())
+                text = f.read()
+            data = json.loads(text)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading ingestion manifest from {self.path}: {e}")
+            return None
+        data = {key: data.get(key, {}) for key in (*self._FIELDS, "versions")}
+        return (stat.st_ino, stat.st_mtime_ns), data
+
+    @contextmanager
+    def _file_lock(self):
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        read = self._read()
+        if read is None:
+            return
+        with self._lock:
+            self._stamp, data = read
+            self.files, self.chunks, self.sources, self.versions = (data[key] for key in (*self._FIELDS, "versions"))
+            self._base = copy.deepcopy(data)
+
+    def _merge(self, stamp, disk: dict):
+        """Take in what another process saved since our base, keeping our own unsaved changes on top."""
+        base = self._base
+        for name in set(base["versions"]) | set(disk["versions"]):
+            if base["versions"].get(name) == disk["versions"].get(name):
+                continue
+            was, now = base["chunks"].get(name, {}), disk["chunks"].get(name, {})
+            changed = {cid for cid, h in now.items() if was.get(cid) != h}
+            removed = set(was) - set(now)
+            entry = self.external_changes.setdefault(name, {"changed": set(), "removed": set()})
+            entry["changed"] = (entry["changed"] - removed) | changed
+            entry["removed"] = (entry["removed"] - changed) | removed
+
+        merged = copy.deepcopy(disk)
+        for field in self._FIELDS:
+            ours, theirs = getattr(self, field), merged[field]
+            for collection in set(ours) | set(base[field]):
+                mine, was = ours.get(collection, {}), base[field].get(collection, {})
+                target = theirs.setdefault(collection, {})
+                for key, value in mine.items():
+                    if was.get(key) != value:
+                        target[key] = value
+                for key in set(was) - set(mine):
+                    target.pop(key, None)
+                if not target and collection not in ours:
+                    del theirs[collection]
+            setattr(self, field, theirs)
+        # Versions only need to keep growing, so both processes' bumps are added up
+        versions = merged["versions"]
+        for name in set(self.versions) | set(base["versions"]):
+            bumps = self.versions.get(name, 0) - base["versions"].get(name, 0)
+            if bumps:
+                versions[name] = versions.get(name, 0) + bumps
+        self.versions = versions
+        self._base = disk
+        self._stamp = stamp
+
+    def reload_if_changed(self) -> bool:
+        """Merge in what another process saved since we last read or wrote the file.
+
+        One stat() per call, so it is cheap enough to run before every question.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns) == self._stamp:
+            return False
+        read = self._read()
+        if read is None:
+            return False
+        with self._lock:
+            self._merge(*read)
+        return True
+
+    def pop_external_changes(self, min_interval: float = 0) -> Dict[str, dict]:
+        """Hand over the external changes at most once per `min_interval` seconds; they accumulate until then."""
+        with self._lock:
+            if not self.external_changes or (
+                    self._last_pop is not None and time.monotonic() - self._last_pop < min_interval):
+                return {}
+            self._last_pop = time.monotonic()
+            changed, self.external_changes = self.external_changes, {}
+        return changed
+
+    def save(self):
+        with self._lock, self._file_lock():
+            self.reload_if_changed()
+            data = json.dumps({
+                "version": 1,
+                "files": self.files,
+                "chunks": self.chunks,
+                "sources": self.sources,
+                "versions": self.versions,
+            })
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+            stat = os.stat(self.path)
+            self._stamp = (stat.st_ino, stat.st_mtime_ns)
+            self._base = {key: value for key, value in json.loads(data).items() if key != "version"}
+
+    def has_file(self, collection_name: str, file_hash: str) -> bool:
+        return file_hash in self.files.get(collection_name, {})
+
+    def record_file(self, collection_name: str, file_hash: str, name: str, chunks: int):
+        with self._lock:
+            self.files.setdefault(collection_name, {})[file_hash] = {
+                "name": name,
+                "chunks": chunks,
+                "ingested_at": datetime.now().isoformat(),
+            }
+
+    def forget_files(self, collection_name: str, name: str):
+        """Drop the recorded file hashes of `name`, whose chunks are no longer those of that content."""
+        with self._lock:
+            files = self.files.get(collection_name, {})
+            for file_hash in [h for h, entry in files.items() if entry.get("name") == name]:
+                del files[file_hash]
+
+    def forget_collection(self, collection_name: str):
+        with self._lock:
+            self.files.pop(collection_name, None)
+            self.chunks.pop(collection_name, None)
+            self.sources.pop(collection_name, None)
+            self.bump_version(collection_name)
+
+    def bump_version(self, collection_name: str):
+        with self._lock:
+            self.versions[collection_name] = self.versions.get(collection_name, 0) + 1
+
+    def corpus_version(self, collection_names: List[str]) -> str:
+        return "-".join(f"{name}:{self.versions.get(name, 0)}" for name in collection_names)
+
+
+def ingest_documents(vectorstore, collection_name: str, docs: List[Document], manifest: IngestionManifest,
+                     source: Optional[str] = None, file_hash: Optional[str] = None, name: Optional[str] = None,
+                     batch_size: int = EMBED_BATCH_SIZE, progress: Optional[ProgressCallback] = None,
+                     keyword_index=None, save: bool = True) -> int:
+    """Upsert only new or changed chunks of `docs`; returns how many were embedded.
+
+    With `source`, chunks that the previous version of that source had but the
+    new one does not are deleted. With `file_hash`, the file is recorded so the
+    next upload of identical bytes can be skipped before parsing. A
+    `keyword_index` is kept in step with the collection. With `save=False` the
+    caller saves the manifest once after a batch of calls.
+    """
+    # Pick up chunks a concurrent bulk_ingest.py run already embedded
+    manifest.reload_if_changed()
+    if manifest.chunks.get(collection_name) and collection_count(vectorstore) == 0:
+        print(f"Collection {collection_name} is empty, discarding its manifest entries")
+        manifest.forget_collection(collection_name)
+
+    unique = {}
+    for i, doc in enumerate(docs):
+        unique[chunk_id(collection_name, doc, i)] = (content_hash(doc.page_content), doc)
+    ids = list(unique)
+    hashes = [h for h, _ in unique.values()]
+    known = manifest.chunks.get(collection_name, {})
+
+    changed = [cid for cid, (h, _) in unique.items() if known.get(cid) != h]
+    stale = []
+    if source is not None:
+        previous = manifest.sources.get(collection_name, {}).get(source, [])
+        stale = sorted(set(previous) - set(ids))
+
+    if stale:
+        vectorstore.delete(ids=stale)
+        if keyword_index is not None:
+            keyword_index.delete(stale)
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        batch_docs = [unique[cid][1] for cid in batch]
+        with span("embed", chunks=len(batch)):
+            vectorstore.add_documents(batch_docs, ids=batch)
+        if keyword_index is not None:
+            keyword_index.upsert(batch, batch_docs)
+        if progress:
+            progress(f"Embedding {name or source or collection_name}", start + len(batch), len(changed))
+
+    with manifest._lock:
+        collection_chunks = manifest.chunks.setdefault(collection_name, {})
+        for cid in stale:
+            collection_chunks.pop(cid, None)
+        collection_chunks.update(zip(ids, hashes))
+        if source is not None:
+            manifest.sources.setdefault(collection_name, {})[source] = ids
+        if file_hash is not None:
+            if source is not None:
+                # The source now holds only this content; an older version's hash must not skip its re-upload
+                manifest.forget_files(collection_name, name or source)
+            manifest.record_file(collection_name, file_hash, name or source or "", len(ids))
+        if changed or stale:
+            manifest.bump_version(collection_name)
+    if save:
+        manifest.save()
+    incr("chunks_embedded", len(changed))
+    incr("chunks_unchanged", len(ids) - len(changed))
+    incr("chunks_deleted", len(stale))
+
+    print(f"Ingested {len(changed)} new or changed of {len(docs)} chunks into {collection_name}"
+          + (f", removed {len(stale)} stale" if stale else ""))
+    return len(changed)
+
+
+def remove_source(vectorstore, collection_name: str, source: str, manifest: IngestionManifest,
+                  keyword_index=None, save: bool = True) -> int:
+    """Delete every chunk last ingested from `source`, e.g. a file removed from a bulk-ingested tree."""
+    manifest.reload_if_changed()
+    with manifest._lock:
+        ids = manifest.sources.get(collection_name, {}).pop(source, [])
+        collection_chunks = manifest.chunks.get(collection_name, {})
+        for cid in ids:
+            collection_chunks.pop(cid, None)
+        manifest.forget_files(collection_name, source)
+        if ids:
+            manifest.bump_version(collection_name)
+    if ids:
+        vectorstore.delete(ids=ids)
+        if keyword_index is not None:
+            keyword_index.delete(ids)
+    if save:
+        manifest.save()
+    incr("chunks_deleted", len(ids))
+    return len(ids)
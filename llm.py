@@ -0,0 +1,86 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from settings import OLLAMA_MODEL, OLLAMA_BASE_URL, OLLAMA_TIMEOUT, OLLAMA_KEEP_ALIVE, OLLAMA_POOL_SIZE
+
+
+class OllamaClient:
+    """Minimal Ollama /api/generate client over one keep-alive HTTP session."""
+
+    def __init__(self, model: str = OLLAMA_MODEL, base_url: str = OLLAMA_BASE_URL,
+                 timeout: float = OLLAMA_TIMEOUT, keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 pool_size: int = OLLAMA_POOL_SIZE, options: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.options = options or {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def stream(self, prompt: str, stop: Optional[List[str]] = None) -> Iterator[str]:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": {**self.options, **({"stop": stop} if stop else {})},
+        }
+        with self.session.post(f"{self.base_url}/api/generate", json=payload, stream=True,
+                               timeout=self.timeout) as response:
+            response.raise_for_status()
+            # Read to the end of the body, even past "done", so the connection goes back to the pool
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+
+    def generate(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        return "".join(self.stream(prompt, stop))
+
+    def ping(self) -> bool:
+        try:
+            return self.session.get(f"{self.base_url}/api/tags", timeout=5).ok
+        except requests.RequestException:
+            return False
+
+    def close(self):
+        self.session.close()
+
+
+class PooledOllama(LLM):
+    """LangChain LLM backed by a shared OllamaClient, so chains reuse its connection."""
+
+    client: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.client.model, "base_url": self.client.base_url}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for token in self.client.stream(prompt, stop):
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,350 @@
+import argparse
+import os
+import pickle
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from settings import DB_DIR, HNSW_PARAMS, COMPACT_DELETED_RATIO
+from tracing import span, incr
+
+CHROMA_DB_FILE = "chroma.sqlite3"
+QUARANTINE_DIR = "quarantine"
+HNSW_SEGMENT_TYPE = "urn:chroma:segment/vector/hnsw-local-persisted"
+INDEX_METADATA_FILE = "index_metadata.pickle"
+# chroma-hnswlib's header.bin: a format version, then the fields of hnswlib's saveIndex()
+# (offsetLevel0, max_elements, cur_element_count, size_data_per_element, ...)
+_HEADER = struct.Struct("<iQQQQ")
+
+
+def hnsw_metadata(collection_name: str, metadata: Optional[dict] = None) -> Optional[dict]:
+    """Collection metadata to create `collection_name` with: its current metadata plus the configured HNSW params."""
+    return {**(metadata or {}), **HNSW_PARAMS.get(collection_name, {})} or None
+
+
+def _is_segment_dir(db_dir: str, name: str) -> bool:
+    try:
+        uuid.UUID(name)
+    except ValueError:
+        return False
+    return os.path.isdir(os.path.join(db_dir, name))
+
+
+def _connect(db_dir: str) -> sqlite3.Connection:
+    # Read-only, so checking never creates or locks the database Chroma is about to open
+    return sqlite3.connect(f"file:{os.path.join(db_dir, CHROMA_DB_FILE)}?mode=ro", uri=True)
+
+
+def sqlite_ok(db_dir: str) -> bool:
+    try:
+        with closing(_connect(db_dir)) as db:
+            return db.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    except sqlite3.DatabaseError as e:
+        print(f"Chroma database in {db_dir} is unreadable: {e}")
+        return False
+
+
+def read_collections(db_dir: str) -> Dict[str, dict]:
+    """Each collection's HNSW segment, its params and record counts, read from chroma.sqlite3 without a client."""
+    with closing(_connect(db_dir)) as db:
+        collections = {
+            name: {"collection_id": collection_id, "segment": segment_id, "topic": topic, "params": {}}
+            for name, collection_id, segment_id, topic in db.execute(
+                "SELECT c.name, c.id, s.id, s.topic FROM collections c JOIN segments s ON s.collection = c.id "
+                "WHERE s.type = ?", (HNSW_SEGMENT_TYPE,)
+            )
+        }
+        by_segment = {info["segment"]: info for info in collections.values()}
+        for segment_id, key, str_value, int_value, float_value in db.execute(
+            "SELECT segment_id, key, str_value, int_value, float_value FROM segment_metadata"
+        ):
+            if segment_id in by_segment:
+                by_segment[segment_id]["params"][key] = next(
+                    (v for v in (int_value, float_value, str_value) if v is not None), None
+                )
+        by_collection = {info["collection_id"]: info for info in collections.values()}
+        for collection_id, count in db.execute(
+            "SELECT s.collection, COUNT(*) FROM embeddings e JOIN segments s ON e.segment_id = s.id "
+            "WHERE s.scope = 'METADATA' GROUP BY s.collection"
+        ):
+            if collection_id in by_collection:
+                by_collection[collection_id]["records"] = count
+        for info in collections.values():
+            info.setdefault("records", 0)
+            info["logged"] = db.execute(
+                "SELECT COUNT(DISTINCT id) FROM embeddings_queue WHERE topic = ?", (info["topic"],)
+            ).fetchone()[0]
+    return collections
+
+
+def inspect_segment(path: str) -> dict:
+    """Cheap consistency check of one HNSW segment directory: file sizes against the header, and the id maps.
+
+    Nothing is loaded into hnswlib, so a damaged index cannot crash the check.
+    A directory without index_metadata.pickle has not reached Chroma's sync
+    threshold yet; Chroma rebuilds it from its log on open, so it is fine.
+    """
+    report = {"vectors": 0, "added": 0, "problems": []}
+    problems = report["problems"]
+    header_file = os.path.join(path, "header.bin")
+    metadata_file = os.path.join(path, INDEX_METADATA_FILE)
+    if not os.path.exists(metadata_file):
+        return report
+    try:
+        with open(header_file, "rb") as f:
+            _, _, max_elements, elements, element_size = _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error) as e:
+        problems.append(f"unreadable header.bin: {e}")
+        return report
+    if elements > max_elements or (elements and not element_size):
+        problems.append(f"header.bin claims {elements} of {max_elements} vectors of {element_size} bytes")
+        return report
+    for name, needed in (("data_level0.bin", elements * element_size), ("length.bin", elements * 4),
+                         ("link_lists.bin", 0)):
+        file = os.path.join(path, name)
+        size = os.path.getsize(file) if os.path.exists(file) else -1
+        if size < needed:
+            problems.append(f"{name} is {size} bytes, {elements} vectors need {needed}")
+
+    try:
+        with open(metadata_file, "rb") as f:
+            data = pickle.load(f)
+        live, added = len(data.id_to_label), data.total_elements_added
+        if len(data.label_to_id) != live:
+            problems.append(f"{INDEX_METADATA_FILE} maps {live} ids to {len(data.label_to_id)} labels")
+        elif live > elements:
+            problems.append(f"{INDEX_METADATA_FILE} lists {live} vectors, the index holds {elements}")
+        report.update(vectors=live, added=added)
+    except Exception as e:
+        problems.append(f"unreadable {INDEX_METADATA_FILE}: {e}")
+    return report
+
+
+def check_collections(db_dir: str = DB_DIR) -> Dict[str, dict]:
+    collections = read_collections(db_dir)
+    for name, info in collections.items():
+        info.update(inspect_segment(os.path.join(db_dir, info["segment"])))
+        # Chroma persists the index only as additions pass its sync threshold, never after deletes, so
+        # the slots it has used are compared with the live records in sqlite rather than its own id map
+        info["deleted_ratio"] = 1 - info["records"] / info["added"] if info["added"] > info["records"] else 0.0
+        wanted = HNSW_PARAMS.get(name, {})
+        info["params_ok"] = all(info["params"].get(key) == value for key, value in wanted.items())
+    return collections
+
+
+def find_orphan_segments(db_dir: str = DB_DIR) -> List[str]:
+    """Segment directories no collection points to, e.g. left by delete_collection() on a collection this process never opened."""
+    if os.path.exists(os.path.join(db_dir, CHROMA_DB_FILE)):
+        with closing(_connect(db_dir)) as db:
+            known: Set[str] = {row[0] for row in db.execute("SELECT id FROM segments")}
+    else:
+        known = set()
+    return sorted(name for name in os.listdir(db_dir) if _is_segment_dir(db_dir, name) and name not in known)
+
+
+def gc_orphan_segments(db_dir: str = DB_DIR, dry_run: bool = False) -> List[str]:
+    orphans = find_orphan_segments(db_dir)
+    for name in orphans:
+        print(f"{'Would remove' if dry_run else 'Removing'} orphaned segment {name}")
+        if not dry_run:
+            shutil.rmtree(os.path.join(db_dir, name), ignore_errors=True)
+    incr("orphan_segments_removed", 0 if dry_run else len(orphans))
+    return orphans
+
+
+def quarantine_segment(db_dir: str, segment_id: str) -> Optional[str]:
+    """Move a damaged segment directory aside; Chroma then rebuilds that one index from its log when the collection is opened."""
+    source = os.path.join(db_dir, segment_id)
+    if not os.path.isdir(source):
+        return None
+    target = os.path.join(db_dir, QUARANTINE_DIR, f"{segment_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(source, target)
+    return target
+
+
+def backup_chroma_files(db_dir: str = DB_DIR) -> str:
+    """Last resort when chroma.sqlite3 itself is unreadable: move the Chroma files aside.
+
+    The constitution snapshot and article index stay. The ingestion manifest
+    stays too, so the caller must forget the moved collections in it, or
+    their files would be skipped as already loaded.
+    """
+    backup_dir = f"{db_dir.rstrip('/')}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(backup_dir, exist_ok=True)
+    for name in os.listdir(db_dir):
+        if name.startswith(CHROMA_DB_FILE) or _is_segment_dir(db_dir, name):
+            shutil.move(os.path.join(db_dir, name), os.path.join(backup_dir, name))
+    print(f"Moved Chroma database to {backup_dir}")
+    return backup_dir
+
+
+def startup_check(db_dir: str = DB_DIR, dry_run: bool = False, deep: bool = False) -> dict:
+    """Check every collection before Chroma opens them and repair only the damaged ones.
+
+    Returns {"status": "ok" | "damaged" | "repaired" | "corrupt", "collections",
+    "repaired", "reembed", "orphans"}. A damaged index is quarantined and
+    rebuilt by Chroma from its log; if the log no longer holds every record,
+    the collection is listed in "reembed" for the caller to rebuild from its
+    documents. "corrupt" means chroma.sqlite3 itself is unreadable. With
+    `dry_run` nothing is moved or deleted and damage is reported as "damaged";
+    other processes may have the segments open, so the app only ever checks.
+    """
+    result = {"status": "ok", "collections": {}, "repaired": [], "reembed": [], "orphans": []}
+    if not os.path.isdir(db_dir):
+        return result
+    with span("integrity_check"):
+        if os.path.exists(os.path.join(db_dir, CHROMA_DB_FILE)):
+            if not sqlite_ok(db_dir):
+                result["status"] = "corrupt"
+                return result
+            result["collections"] = check_collections(db_dir)
+        for name, info in result["collections"].items():
+            if deep and not info["problems"]:
+                error = probe_collection(db_dir, name)
+                if error:
+                    info["problems"].append(f"query failed: {error}")
+            if info["problems"]:
+                print(f"Collection {name} is damaged: {'; '.join(info['problems'])}")
+                if not dry_run:
+                    quarantine_segment(db_dir, info["segment"])
+                result["repaired"].append(name)
+                if info["logged"] < info["records"]:
+                    result["reembed"].append(name)
+            elif not info["params_ok"]:
+                print(f"Collection {name} was built with {info['params']}, not the configured "
+                      f"{HNSW_PARAMS.get(name)}; run python maintenance.py --apply-hnsw")
+        result["orphans"] = gc_orphan_segments(db_dir, dry_run)
+    if result["repaired"] and dry_run:
+        result["status"] = "damaged"
+    elif result["repaired"]:
+        result["status"] = "repaired"
+        incr("collections_repaired", len(result["repaired"]))
+    return result
+
+
+def rebuild_collection(client, name: str, ids: Optional[List[str]] = None, embedding=None, batch_size: int = 1000):
+    """Recreate collection `name` with the configured HNSW params and return it.
+
+    Records (all, or only `ids`) are copied with their stored vectors, so
+    nothing is re-embedded and deleted vectors no longer take index slots.
+    With `embedding`, documents are embedded again instead, for an index
+    that cannot be read. The copy is built under a temporary name and only
+    renamed to `name` after the old collection is deleted, so a crash
+    midway leaves the old collection in place. The caller must keep writers
+    out meanwhile.
+    """
+    old = client.get_collection(name)
+    include = ["documents", "metadatas"] + ([] if embedding is not None else ["embeddings"])
+    if ids is not None and not ids:
+        records = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    else:
+        records = old.get(ids=ids, include=include)
+    temp_name = f"{name}_rebuild_{uuid.uuid4().hex[:8]}"
+    collection = client.create_collection(temp_name, metadata=hnsw_metadata(name, old.metadata))
+    try:
+        for start in range(0, len(records["ids"]), batch_size):
+            end = start + batch_size
+            documents = records["documents"][start:end]
+            collection.add(
+                ids=records["ids"][start:end],
+                embeddings=embedding.embed_documents(documents) if embedding is not None else records["embeddings"][start:end],
+                documents=documents,
+                metadatas=records["metadatas"][start:end],
+            )
+    except Exception:
+        client.delete_collection(temp_name)
+        raise
+    client.delete_collection(name)
+    try:
+        collection.modify(name=name)
+    except Exception:
+        print(f"Rebuilt {name} is still named {temp_name}; rename it with collection.modify(name={name!r})")
+        raise
+    incr("collections_rebuilt")
+    return collection
+
+
+def probe_collection(db_dir: str, name: str, timeout: float = 300) -> Optional[str]:
+    """Open and query one collection in a child process, so an index that crashes hnswlib cannot take us down."""
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--db-dir", db_dir, "--probe", name],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return f"no answer within {timeout:.0f} s"
+    if result.returncode != 0:
+        lines = (result.stderr or result.stdout).strip().splitlines()
+        return lines[-1] if lines else f"exit code {result.returncode}"
+    return None
+
+
+def _probe(db_dir: str, name: str):
+    import chromadb
+    client = chromadb.PersistentClient(path=db_dir, settings=chromadb.Settings(anonymized_telemetry=False))
+    collection = client.get_collection(name)
+    count = collection.count()
+    if count:
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"][0]
+        collection.query(query_embeddings=[sample], n_results=min(count, 10))
+    print(f"{name}: {count} records, query ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check, repair and compact the Chroma collections in DB_DIR")
+    parser.add_argument("--db-dir", default=DB_DIR)
+    parser.add_argument("--deep", action="store_true", help="also open and query every collection in a child process")
+    parser.add_argument("--compact", action="store_true",
+                        help=f"rebuild collections with at least {COMPACT_DELETED_RATIO:.0%} deleted vectors")
+    parser.add_argument("--apply-hnsw", action="store_true", help="rebuild collections whose HNSW params differ from settings")
+    parser.add_argument("--dry-run", action="store_true", help="report only, change nothing")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe(args.db_dir, args.probe)
+        return
+
+    start = time.perf_counter()
+    result = startup_check(args.db_dir, dry_run=args.dry_run, deep=args.deep)
+    if result["status"] == "corrupt":
+        raise SystemExit(f"{CHROMA_DB_FILE} in {args.db_dir} is corrupt; move it aside and re-ingest")
+    for name, info in sorted(result["collections"].items()):
+        print(f"{name}: {info['records']} records, {info['vectors']} persisted vectors, "
+              f"{info['deleted_ratio']:.0%} deleted, params {info['params'] or 'default'}"
+              + (f", DAMAGED: {'; '.join(info['problems'])}" if info["problems"] else ""))
+
+    rebuild = [
+        name for name, info in sorted(result["collections"].items())
+        if name in result["reembed"]
+        or (args.compact and info["deleted_ratio"] >= COMPACT_DELETED_RATIO)
+        or (args.apply_hnsw and not info["params_ok"])
+    ]
+    if rebuild and not args.dry_run:
+        from resources import ResourceRegistry
+        registry = ResourceRegistry(args.db_dir)
+        manifest = registry.manifest()
+        for name in rebuild:
+            with span("rebuild_collection", collection=name):
+                collection = rebuild_collection(registry.chroma_client(), name,
+                                                embedding=registry.embeddings() if name in result["reembed"] else None)
+            # Running apps see the version change before their next question and reopen the vectorstore
+            manifest.bump_version(name)
+            print(f"Rebuilt {name} with {collection.count()} records and {collection.metadata}")
+        manifest.save()
+        gc_orphan_segments(args.db_dir)
+    elif rebuild:
+        print(f"Would rebuild: {', '.join(rebuild)}")
+    print(f"Done in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
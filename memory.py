@@ -0,0 +1,293 @@
+import argparse
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from context import CHARS_PER_TOKEN, count_tokens, split_sentences
+from maintenance import rebuild_collection
+from settings import (
+    MEMORY_WINDOW,
+    MEMORY_SUMMARY_TOKENS,
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_MAX_SESSIONS,
+    CHAT_RETENTION_DAYS,
+    CHAT_MAX_ENTRIES,
+    DB_DIR,
+)
+from tracing import span, incr
+
+# Held by the one process that compacts chat_history (see CompactionScheduler)
+COMPACTION_LOCK = os.path.join(DB_DIR, "chat_compaction.lock")
+
+# summarizer(previous summary, question, answer) -> new summary
+Summarizer = Callable[[str, str, str], str]
+
+
+def format_turn(question: str, answer: str) -> str:
+    # Same text ChatHistoryWriter stores, so recalled turns can be matched against the window
+    return f"Q: {question}\nA: {answer}"
+
+
+def _clip(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+class ConversationMemory:
+    """Bounded memory of one conversation: the last `window` turns verbatim plus a rolling summary.
+
+    Turns that fall out of the window are folded into the summary, which is
+    itself capped at `summary_tokens`, so the rendered history stays within
+    `budget_tokens` however long the conversation runs. Older turns are not
+    lost: they are in CHAT_COLLECTION, tagged with this session id, and can be
+    recalled by similarity when a question needs them.
+    """
+
+    def __init__(self, session_id: Optional[str] = None, window: int = MEMORY_WINDOW,
+                 summary_tokens: int = MEMORY_SUMMARY_TOKENS, budget_tokens: int = MEMORY_TOKEN_BUDGET,
+                 summarizer: Optional[Summarizer] = None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.window = window
+        self.summary_tokens = summary_tokens
+        self.budget_tokens = budget_tokens
+        self.summarizer = summarizer
+        self.summary = ""
+        self.total_turns = 0
+        self.turns: "deque[Tuple[str, str]]" = deque()
+        self._lock = threading.Lock()
+
+    def add_turn(self, question: str, answer: str):
+        with self._lock:
+            self.turns.append((question, answer))
+            self.total_turns += 1
+            while len(self.turns) > self.window:
+                old_question, old_answer = self.turns.popleft()
+                self.summary = self._summarize(self.summary, old_question, old_answer)
+
+    def is_empty(self) -> bool:
+        return not self.turns and not self.summary
+
+    def has_older_turns(self) -> bool:
+        return self.total_turns > len(self.turns)
+
+    def in_window(self, text: str) -> bool:
+        return any(format_turn(q, a) == text for q, a in list(self.turns))
+
+    def render(self, recalled: Optional[List[str]] = None) -> str:
+        """Chat history for the prompt: summary, recalled older turns, then the recent window, within the budget."""
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+        if not turns and not summary:
+            return ""
+
+        sections, used = [], 0
+        if summary:
+            sections.append(f"Summary of earlier conversation:\n{summary}")
+            used += count_tokens(sections[-1])
+
+        # Each turn gets an equal share of what is left; newest turns are kept first
+        per_turn = max(32, (self.budget_tokens - used) // max(1, len(turns) + len(recalled or [])))
+        recent = []
+        for question, answer in reversed(turns):
+            text = _clip(format_turn(question, answer), per_turn)
+            if used + count_tokens(text) > self.budget_tokens:
+                break
+            recent.insert(0, text)
+            used += count_tokens(text)
+        relevant = []
+        for text in recalled or []:
+            text = _clip(text, per_turn)
+            if used + count_tokens(text) > self.budget_tokens:
+                break
+            relevant.append(text)
+            used += count_tokens(text)
+
+        if relevant:
+            sections.append("Relevant earlier turns:\n" + "\n".join(relevant))
+        if recent:
+            sections.append("Recent turns:\n" + "\n".join(recent))
+        return "\n\n".join(sections)
+
+    def _summarize(self, summary: str, question: str, answer: str) -> str:
+        if self.summarizer is not None:
+            try:
+                return _clip(self.summarizer(summary, question, answer), self.summary_tokens)
+            except Exception as e:
+                print(f"Error summarizing conversation, keeping an extractive summary: {e}")
+        # Extractive: one line per turn, oldest lines dropped once over the cap
+        first = lambda text: (split_sentences(text) or [""])[0]
+        line = _clip(f"- {_clip(first(question), 40)} -> {_clip(first(answer), 60)}", self.summary_tokens)
+        lines = summary.splitlines() + [line]
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+
+def llm_summarizer(llm) -> Summarizer:
+    def summarize(summary: str, question: str, answer: str) -> str:
+        prompt = (
+            "Update the running summary of a conversation about the Constitution of Kazakhstan "
+            "with the exchange below. Keep it under 100 words and keep article numbers.\n\n"
+            f"Summary so far:\n{summary or '(empty)'}\n\nQuestion: {question}\nAnswer: {answer}\n\nUpdated summary:"
+        )
+        return llm.invoke(prompt).strip()
+    return summarize
+
+
+class MemoryStore:
+    """Conversation memories by session id, least recently used dropped past `max_sessions`."""
+
+    def __init__(self, max_sessions: int = MEMORY_MAX_SESSIONS, factory: Callable[[str], ConversationMemory] = None):
+        self.max_sessions = max_sessions
+        self.factory = factory or (lambda session_id: ConversationMemory(session_id))
+        self._lock = threading.Lock()
+        self._memories: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+
+    def get(self, session_id: str) -> ConversationMemory:
+        with self._lock:
+            memory = self._memories.get(session_id)
+            if memory is None:
+                memory = self._memories[session_id] = self.factory(session_id)
+            self._memories.move_to_end(session_id)
+            while len(self._memories) > self.max_sessions:
+                self._memories.popitem(last=False)
+            return memory
+
+
+def _parse_timestamp(value) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.min
+
+
+def compact_chat_history(vectorstore, max_age_days: float = CHAT_RETENTION_DAYS, max_entries: int = CHAT_MAX_ENTRIES,
+                         lock: Optional[threading.Lock] = None, rebuild: bool = True, batch_size: int = 1000,
+                         manifest=None) -> dict:
+    """Evict chat turns older than `max_age_days` or beyond the newest `max_entries`, then rebuild the collection.
+
+    Chroma's HNSW index only marks deleted vectors and never reuses their
+    slots, so deleting alone does not stop it growing. After evicting, the
+    survivors are copied with their stored embeddings (no re-embedding) into a
+    fresh collection under the same name (maintenance.rebuild_collection). `lock` is held throughout so the
+    chat writer cannot insert into the collection while it is being replaced. The collection's version in
+    the ingestion manifest (default: the app's) is bumped, so other processes reopen it.
+    """
+    collection = vectorstore._collection
+    with lock or threading.Lock(), span("chat_compaction"):
+        stored = collection.get(include=["metadatas"])
+        entries = sorted(
+            zip(stored["ids"], stored["metadatas"] or [{}] * len(stored["ids"])),
+            key=lambda entry: _parse_timestamp((entry[1] or {}).get("timestamp")),
+            reverse=True,
+        )
+        cutoff = datetime.now() - timedelta(days=max_age_days) if max_age_days else None
+        keep, evict = [], []
+        for entry_id, metadata in entries:
+            too_old = cutoff is not None and _parse_timestamp((metadata or {}).get("timestamp")) < cutoff
+            if too_old or (max_entries and len(keep) >= max_entries):
+                evict.append(entry_id)
+            else:
+                keep.append(entry_id)
+
+        if evict and rebuild:
+            vectorstore._collection = rebuild_collection(vectorstore._client, collection.name, ids=keep,
+                                                         batch_size=batch_size)
+        elif evict:
+            for start in range(0, len(evict), batch_size):
+                collection.delete(ids=evict[start:start + batch_size])
+
+    if evict:
+        if manifest is None:
+            from resources import get_registry
+            manifest = get_registry().manifest()
+        manifest.bump_version(collection.name)
+        manifest.save()
+    incr("chat_turns_evicted", len(evict))
+    result = {"kept": len(keep), "evicted": len(evict), "rebuilt": bool(evict and rebuild)}
+    print(f"Chat history compaction: {result}")
+    return result
+
+
+def try_lock(path: str):
+    """Take an exclusive lock on `path` without waiting; returns the open lock file to hold, or None if taken."""
+    try:
+        import fcntl
+    except ImportError:
+        return open(path, "a")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class CompactionScheduler:
+    """Runs compact_chat_history on a daemon thread: once shortly after start, then every `interval` seconds.
+
+    With `lock_path`, only the process holding that file lock compacts; the app and the API can share
+    one DB_DIR and the first of them to get the lock keeps it until it exits.
+    """
+
+    def __init__(self, job: Callable[[], dict], interval: float, initial_delay: float = 60,
+                 lock_path: Optional[str] = None):
+        self.job = job
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-compaction", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = self.initial_delay
+        while not self._stop.wait(delay):
+            delay = self.interval
+            if self.lock_path and self._lock_file is None:
+                self._lock_file = try_lock(self.lock_path)
+                if self._lock_file is None:
+                    continue
+            try:
+                self.job()
+            except Exception as e:
+                print(f"Error compacting chat history: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evict old chat turns and rebuild the chat_history collection")
+    parser.add_argument("--max-age-days", type=float, default=CHAT_RETENTION_DAYS)
+    parser.add_argument("--max-entries", type=int, default=CHAT_MAX_ENTRIES)
+    parser.add_argument("--no-rebuild", action="store_true", help="only delete, keep the existing index")
+    args = parser.parse_args()
+
+    from constitution_qa import get_chat_writer, get_vectorstore
+    from settings import CHAT_COLLECTION
+    lock_file = try_lock(COMPACTION_LOCK)
+    if lock_file is None:
+        raise SystemExit("A running app or API is compacting chat_history; stop it first or let it do the job")
+    with lock_file:
+        start = time.perf_counter()
+        compact_chat_history(get_vectorstore(CHAT_COLLECTION), args.max_age_days, args.max_entries,
+                             lock=get_chat_writer().lock, rebuild=not args.no_rebuild)
+        print(f"Done in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from settings import QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS
+from tracing import span
+
+
+class BatchingEmbeddings(Embeddings):
+    """Groups concurrent embed_query() calls into one embed_documents() pass.
+
+    Each caller enqueues its text and waits on a future. A single worker takes
+    the first queued query, collects whatever else arrives within max_wait_ms
+    (up to max_batch) and embeds them together, so under concurrent load the
+    model runs one forward pass per batch instead of one per request. A lone
+    query waits at most max_wait_ms extra. embed_documents() is passed through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = QUERY_BATCH_SIZE,
+                 max_wait_ms: float = QUERY_BATCH_WAIT_MS):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.queries = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": self.queries / self.batches if self.batches else 0.0,
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._embed(batch)
+
+    def _embed(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            with span("embed_query_batch", queries=len(texts)):
+                vectors = self.embeddings.embed_documents(texts) if len(texts) > 1 else [self.embeddings.embed_query(texts[0])]
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.queries += len(batch)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
@@ -0,0 +1,346 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import chromadb
+from langchain_core.embeddings import Embeddings
+
+from articles import ArticleIndex, ARTICLE_INDEX_FILE
+from ingestion import IngestionManifest, MANIFEST_FILE
+from answer_cache import SemanticAnswerCache
+from settings import (
+    DB_DIR,
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_FILE,
+    ONNX_THREADS,
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    PARSE_WORKERS,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_PERSIST,
+    ANSWER_CACHE_SAVE_SECONDS,
+)
+
+_MISSING = object()
+# reopen_collection reaches into the segment manager's private state, which only this release line has
+REOPEN_CHROMA_VERSION = "0.4."
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from the quantized ONNX export of the MiniLM model.
+
+    Mirrors the sentence-transformers pipeline for this model (mean pooling, no
+    normalization) so vectors are interchangeable with the torch backend.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, model_file: str = ONNX_MODEL_FILE,
+                 threads: int = ONNX_THREADS, batch_size: int = 64):
+        import numpy as np
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoTokenizer
+
+        self._np = np
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_path = model_file if os.path.exists(model_file) else hf_hub_download(model_name, model_file)
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        np = self._np
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [t.replace("\n", " ") for t in texts[start:start + self.batch_size]]
+            encoded = self.tokenizer(batch, padding=True, truncation=True, max_length=128, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+class ResourceRegistry:
+    """Process-wide holder for the expensive, shareable handles.
+
+    Lives in its own module so Streamlit reruns (which re-execute the app
+    script) and every browser session reuse the same objects.
+    """
+
+    def __init__(self, db_dir: str = DB_DIR, embedding_backend: str = EMBEDDING_BACKEND):
+        self.db_dir = db_dir
+        self.embedding_backend = embedding_backend
+        self._lock = threading.RLock()
+        # One lock per slow-to-build object, so loading one never blocks lookups of the others
+        self._key_locks = {}
+        # Keys whose factory is running -> True once the key was dropped meanwhile, so the result is stale
+        self._building = {}
+        self._embeddings = None
+        self._query_embeddings = None
+        self._chroma_client = None
+        self._llm = None
+        self._article_index = None
+        self._manifest = None
+        self._text_splitter = None
+        self._parse_executor = None
+        self._cache = {}
+        self._answer_cache = None
+
+    def _key_lock(self, key) -> threading.RLock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.RLock())
+
+    def embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            with self._key_lock("embeddings"):
+                if self._embeddings is None:
+                    self._embeddings = self._load_embeddings()
+        return self._embeddings
+
+    def query_embeddings(self) -> Embeddings:
+        """Embeddings for questions: concurrent embed_query() calls share one batched pass."""
+        if self._query_embeddings is None:
+            with self._key_lock("query_embeddings"):
+                if self._query_embeddings is None:
+                    from query_batcher import BatchingEmbeddings
+                    self._query_embeddings = BatchingEmbeddings(self.embeddings())
+        return self._query_embeddings
+
+    def _load_embeddings(self) -> Embeddings:
+        if self.embedding_backend == "fake":
+            # Hash-based vectors with no model download, for benchmarks and offline runs
+            from langchain_community.embeddings import DeterministicFakeEmbedding
+            print("Using fake embeddings")
+            return DeterministicFakeEmbedding(size=384)
+        if self.embedding_backend == "onnx":
+            try:
+                embeddings = OnnxEmbeddings()
+                print(f"Loaded ONNX embedding backend: {ONNX_MODEL_FILE}")
+                return embeddings
+            except Exception as e:
+                print(f"ONNX embedding backend unavailable, falling back to torch: {e}")
+
+        from langchain_huggingface import HuggingFaceEmbeddings
+        print(f"Loading embedding model: {EMBEDDING_MODEL}")
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={"device": "cpu"}
+        )
+
+    def chroma_client(self):
+        if self._chroma_client is None:
+            with self._lock:
+                if self._chroma_client is None:
+                    os.makedirs(self.db_dir, exist_ok=True)
+                    self._chroma_client = chromadb.PersistentClient(
+                        path=self.db_dir,
+                        settings=chromadb.Settings(
+                            is_persistent=True,
+                            persist_directory=self.db_dir,
+                            anonymized_telemetry=False
+                        )
+                    )
+        return self._chroma_client
+
+    def reset_chroma_client(self, keep=()):
+        """Drop the client and everything built on it; cached objects whose key starts with a name in `keep` survive."""
+        with self._lock:
+            if self._chroma_client is not None:
+                try:
+                    self._chroma_client.clear_system_cache()
+                except Exception as e:
+                    print(f"Error clearing chroma system cache: {e}")
+            self._chroma_client = None
+            for key in list(self._cache) + list(self._building):
+                if isinstance(key, tuple) and key[0] in keep:
+                    continue
+                self._drop(key)
+
+    def reopen_collection(self, name: str, collection_id=None) -> bool:
+        """Make the next query load collection `name`'s HNSW index from disk again.
+
+        Chroma keeps an opened index in memory and never sees vectors another
+        process added to it, so this process's copy is dropped; the new one
+        replays Chroma's log from where the files on disk end. Returns False
+        if `name` no longer has `collection_id` (it was rebuilt or deleted).
+        Raises RuntimeError on other chromadb versions, whose internals differ;
+        the caller then resets the whole client instead.
+        """
+        if self._chroma_client is None:
+            return True
+        if not chromadb.__version__.startswith(REOPEN_CHROMA_VERSION):
+            raise RuntimeError(f"reopening a single collection needs chromadb {REOPEN_CHROMA_VERSION}x, "
+                               f"found {chromadb.__version__}")
+        from chromadb.types import SegmentScope
+        try:
+            collection = self._chroma_client.get_collection(name)
+        except Exception:
+            return False
+        if collection_id is not None and collection.id != collection_id:
+            return False
+        manager = self._chroma_client._server._manager
+        with manager._lock:
+            segment = manager.segment_cache[SegmentScope.VECTOR].pop(collection.id)
+            instance = manager._instances.pop(segment["id"], None) if segment else None
+            manager._vector_instances_file_handle_cache.cache.pop(collection.id, None)
+        if instance is not None:
+            instance.stop()
+            instance.close_persistent_index()
+        return True
+
+    def cached(self, key):
+        return self._cache.get(key)
+
+    def discard(self, *keys):
+        """Drop (and close) cached objects so they are built again on next use."""
+        with self._lock:
+            for key in keys:
+                self._drop(key)
+
+    def _drop(self, key, close: bool = True):
+        # Caller holds self._lock
+        if key in self._building:
+            self._building[key] = True
+        value = self._cache.pop(key, None)
+        if close and hasattr(value, "close"):
+            value.close()
+
+    def llm(self):
+        if self._llm is None:
+            with self._key_lock("llm"):
+                if self._llm is None:
+                    from llm import OllamaClient, PooledOllama
+                    self._llm = PooledOllama(client=OllamaClient())
+        return self._llm
+
+    def get_or_create(self, key, factory):
+        """Process-wide memo for objects built from the shared handles (vectorstores, chains).
+
+        Each key is built under its own lock, so a slow factory only holds up
+        callers waiting for that same key.
+        """
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._key_lock(key):
+            while True:
+                value = self._cache.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                with self._lock:
+                    self._building[key] = False
+                try:
+                    value = factory()
+                except BaseException:
+                    with self._lock:
+                        self._building.pop(key, None)
+                    raise
+                with self._lock:
+                    if not self._building.pop(key):
+                        self._cache[key] = value
+                        return value
+                # Dropped while building, so the value may hold a handle that was just released
+                if hasattr(value, "close"):
+                    value.close()
+
+    def invalidate(self, prefix=None):
+        with self._lock:
+            for key in list(self._cache) + list(self._building):
+                if prefix is None or (isinstance(key, tuple) and key[0] == prefix):
+                    self._drop(key, close=False)
+
+    def article_index(self) -> ArticleIndex:
+        if self._article_index is None:
+            with self._lock:
+                if self._article_index is None:
+                    index = ArticleIndex(os.path.join(self.db_dir, ARTICLE_INDEX_FILE))
+                    if index.load():
+                        print(f"Loaded article index with {len(index)} articles")
+                    self._article_index = index
+        return self._article_index
+
+    def manifest(self) -> IngestionManifest:
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = IngestionManifest(os.path.join(self.db_dir, MANIFEST_FILE))
+        return self._manifest
+
+    def answer_cache(self) -> Optional[SemanticAnswerCache]:
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        if self._answer_cache is None:
+            with self._lock:
+                if self._answer_cache is None:
+                    self._answer_cache = SemanticAnswerCache(
+                        threshold=ANSWER_CACHE_THRESHOLD,
+                        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                        ttl=ANSWER_CACHE_TTL,
+                        path=os.path.join(self.db_dir, "answer_cache.json") if ANSWER_CACHE_PERSIST else None,
+                        save_interval=ANSWER_CACHE_SAVE_SECONDS,
+                    )
+        return self._answer_cache
+
+    def text_splitter(self):
+        if self._text_splitter is None:
+            with self._key_lock("text_splitter"):
+                if self._text_splitter is None:
+                    self._text_splitter = self._load_text_splitter()
+        return self._text_splitter
+
+    def _load_text_splitter(self):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+            return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+                tokenizer, chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS
+            )
+        except Exception as e:
+            # ~3 characters per token keeps multilingual text under the model limit
+            print(f"Tokenizer unavailable, splitting by characters instead: {e}")
+            return RecursiveCharacterTextSplitter(
+                chunk_size=CHUNK_TOKENS * 3, chunk_overlap=CHUNK_OVERLAP_TOKENS * 3
+            )
+
+    def parse_executor(self) -> Optional[ProcessPoolExecutor]:
+        # spawn, not fork: the app process is multi-threaded and may hold torch state
+        if PARSE_WORKERS < 2:
+            return None
+        if self._parse_executor is None:
+            with self._lock:
+                if self._parse_executor is None:
+                    self._parse_executor = ProcessPoolExecutor(
+                        max_workers=PARSE_WORKERS,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._parse_executor
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ResourceRegistry()
+    return _registry
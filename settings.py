@@ -0,0 +1,106 @@
+import os
+
+DB_DIR = os.environ.get("CQA_DB_DIR", "vectorstore/")
+CHAT_COLLECTION = "chat_history"
+CONSTITUTION_COLLECTION = "constitution"
+UPLOADS_COLLECTION = "uploaded_docs"
+CONSTITUTION_PATH = "data/akorda.kz-Constitution of the Republic of Kazakhstan.pdf"
+# Prebuilt constitution embeddings (path prefix of a .npy + .json pair, see snapshot.py); with
+# CQA_SNAPSHOT_SEARCH on, the constitution is searched exactly in memory and Chroma holds only uploads
+CONSTITUTION_SNAPSHOT = os.environ.get("CQA_CONSTITUTION_SNAPSHOT", "data/constitution_snapshot")
+SNAPSHOT_SEARCH = os.environ.get("CQA_SNAPSHOT_SEARCH", "1") not in ("0", "false", "no")
+
+EMBEDDING_MODEL = os.environ.get("CQA_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+# "torch" uses sentence-transformers, "onnx" runs the int8-quantized export through onnxruntime,
+# "fake" hashes text into random vectors (benchmarks and offline testing only)
+EMBEDDING_BACKEND = os.environ.get("CQA_EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_FILE = os.environ.get("CQA_ONNX_MODEL_FILE", "onnx/model_quint8_avx2.onnx")
+ONNX_THREADS = int(os.environ.get("CQA_ONNX_THREADS", "0"))
+
+# Upload ingestion: chunk sizes are in embedding-model tokens (MiniLM reads at most 128)
+CHUNK_TOKENS = int(os.environ.get("CQA_CHUNK_TOKENS", "120"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CQA_CHUNK_OVERLAP_TOKENS", "20"))
+EMBED_BATCH_SIZE = int(os.environ.get("CQA_EMBED_BATCH_SIZE", "256"))
+PARSE_WORKERS = int(os.environ.get("CQA_PARSE_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+PDF_PAGES_PER_TASK = int(os.environ.get("CQA_PDF_PAGES_PER_TASK", "25"))
+# A running app reopens collections that bulk_ingest.py changed at most once per this many seconds
+EXTERNAL_SYNC_SECONDS = float(os.environ.get("CQA_EXTERNAL_SYNC_SECONDS", "10"))
+
+# Semantic answer cache: questions within ANSWER_CACHE_THRESHOLD cosine similarity share an answer
+ANSWER_CACHE_ENABLED = os.environ.get("CQA_ANSWER_CACHE", "1") not in ("0", "false", "no")
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("CQA_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("CQA_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.environ.get("CQA_ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_PERSIST = os.environ.get("CQA_ANSWER_CACHE_PERSIST", "0") not in ("0", "false", "no")
+# A persisted cache is written at most once per this many seconds (and at exit), not on every answer
+ANSWER_CACHE_SAVE_SECONDS = float(os.environ.get("CQA_ANSWER_CACHE_SAVE_SECONDS", "5"))
+
+# Retrieval: dense + BM25 per collection, fused with reciprocal-rank fusion
+HYBRID_RETRIEVAL = os.environ.get("CQA_HYBRID_RETRIEVAL", "1") not in ("0", "false", "no")
+RETRIEVAL_K = int(os.environ.get("CQA_RETRIEVAL_K", "5"))
+RETRIEVAL_FETCH_K = int(os.environ.get("CQA_RETRIEVAL_FETCH_K", "10"))
+RETRIEVAL_WORKERS = int(os.environ.get("CQA_RETRIEVAL_WORKERS", "8"))
+# Concurrent query embeddings are grouped into batches of up to QUERY_BATCH_SIZE
+QUERY_BATCH_SIZE = int(os.environ.get("CQA_QUERY_BATCH_SIZE", "32"))
+QUERY_BATCH_WAIT_MS = float(os.environ.get("CQA_QUERY_BATCH_WAIT_MS", "5"))
+
+# Context packing: retrieved chunks are deduplicated, ranked and trimmed to fit this many prompt tokens
+CONTEXT_PACKING = os.environ.get("CQA_CONTEXT_PACKING", "1") not in ("0", "false", "no")
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CQA_CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_DEDUP_THRESHOLD = float(os.environ.get("CQA_CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_TRIM_SENTENCES = os.environ.get("CQA_CONTEXT_TRIM_SENTENCES", "1") not in ("0", "false", "no")
+
+# Chat turns are written to CHAT_COLLECTION in the background, in batches
+CHAT_WRITE_BATCH_SIZE = int(os.environ.get("CQA_CHAT_WRITE_BATCH_SIZE", "32"))
+CHAT_WRITE_FLUSH_SECONDS = float(os.environ.get("CQA_CHAT_WRITE_FLUSH_SECONDS", "2"))
+
+# Conversation memory: last MEMORY_WINDOW turns verbatim + a rolling summary, within MEMORY_TOKEN_BUDGET
+MEMORY_WINDOW = int(os.environ.get("CQA_MEMORY_WINDOW", "4"))
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("CQA_MEMORY_SUMMARY_TOKENS", "150"))
+MEMORY_TOKEN_BUDGET = int(os.environ.get("CQA_MEMORY_TOKEN_BUDGET", "500"))
+MEMORY_RECALL_K = int(os.environ.get("CQA_MEMORY_RECALL_K", "2"))
+MEMORY_LLM_SUMMARY = os.environ.get("CQA_MEMORY_LLM_SUMMARY", "0") not in ("0", "false", "no")
+MEMORY_MAX_SESSIONS = int(os.environ.get("CQA_MEMORY_MAX_SESSIONS", "1000"))
+# Retention of CHAT_COLLECTION: turns older than this many days or beyond the newest CHAT_MAX_ENTRIES are evicted
+CHAT_RETENTION_DAYS = float(os.environ.get("CQA_CHAT_RETENTION_DAYS", "30"))
+CHAT_MAX_ENTRIES = int(os.environ.get("CQA_CHAT_MAX_ENTRIES", "10000"))
+CHAT_COMPACT_INTERVAL_HOURS = float(os.environ.get("CQA_CHAT_COMPACT_INTERVAL_HOURS", "6"))
+
+
+def _hnsw_params(collection: str, M: int, construction_ef: int, search_ef: int) -> dict:
+    # Override per collection with e.g. CQA_HNSW_UPLOADED_DOCS="M=32,search_ef=128"
+    params = {"M": M, "construction_ef": construction_ef, "search_ef": search_ef}
+    for item in os.environ.get(f"CQA_HNSW_{collection.upper()}", "").split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            params[key.strip()] = int(value)
+    return {f"hnsw:{key}": value for key, value in params.items()}
+
+
+# HNSW index parameters of each Chroma collection, applied when it is created or rebuilt (maintenance.py)
+HNSW_PARAMS = {
+    UPLOADS_COLLECTION: _hnsw_params(UPLOADS_COLLECTION, M=16, construction_ef=200, search_ef=64),
+    CHAT_COLLECTION: _hnsw_params(CHAT_COLLECTION, M=16, construction_ef=100, search_ef=32),
+    CONSTITUTION_COLLECTION: _hnsw_params(CONSTITUTION_COLLECTION, M=16, construction_ef=200, search_ef=64),
+}
+# Collections whose index holds at least this fraction of deleted vectors are rebuilt by maintenance.py --compact
+COMPACT_DELETED_RATIO = float(os.environ.get("CQA_COMPACT_DELETED_RATIO", "0.2"))
+# Check every collection's index files at startup and report damage (maintenance.py repairs it)
+INTEGRITY_CHECK = os.environ.get("CQA_INTEGRITY_CHECK", "1") not in ("0", "false", "no")
+
+OLLAMA_MODEL = os.environ.get("CQA_OLLAMA_MODEL", "mistral")
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.environ.get("CQA_OLLAMA_TIMEOUT", "300"))
+OLLAMA_KEEP_ALIVE = os.environ.get("CQA_OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_POOL_SIZE = int(os.environ.get("CQA_OLLAMA_POOL_SIZE", "8"))
+STREAM_ANSWERS = os.environ.get("CQA_STREAM_ANSWERS", "1") not in ("0", "false", "no")
+
+# HTTP service (api.py)
+API_HOST = os.environ.get("CQA_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("CQA_API_PORT", "8000"))
+
+# Observability: 0 = quiet, 1 = print every traced span, 2 = also dump extracted articles and retrieved documents
+DEBUG_LEVEL = int(os.environ.get("CQA_DEBUG", "0"))
+METRICS_ENABLED = os.environ.get("CQA_METRICS", "1") not in ("0", "false", "no")
+# Write the metrics snapshot as JSON to this path at exit
+METRICS_FILE = os.environ.get("CQA_METRICS_FILE", "")
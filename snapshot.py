@@ -0,0 +1,289 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from settings import (
+    DB_DIR,
+    CONSTITUTION_COLLECTION,
+    CONSTITUTION_PATH,
+    CONSTITUTION_SNAPSHOT,
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+)
+
+FORMAT_VERSION = 1
+RUNTIME_SNAPSHOT = os.path.join(DB_DIR, "constitution_snapshot")
+
+
+def embedding_id(backend: str = EMBEDDING_BACKEND) -> str:
+    # torch and onnx produce interchangeable vectors for the same model; fake vectors match nothing
+    return "fake" if backend == "fake" else EMBEDDING_MODEL
+
+
+def file_sha256(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _matrix_record(matrix: np.ndarray) -> dict:
+    return {"rows": int(matrix.shape[0]), "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "sha256": hashlib.sha256(np.ascontiguousarray(matrix).tobytes()).hexdigest()}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _matches(metadata: dict, where: Optional[dict]) -> bool:
+    # The subset of Chroma's where syntax the app uses: {"key": value} and {"key": {"$gte": value}}
+    for key, condition in (where or {}).items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if value is None or (op == "$gte" and not value >= operand) or (op == "$eq" and value != operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class SnapshotVectorStore(VectorStore):
+    """Exact cosine-similarity search over a small embedding matrix kept as .npy + JSON sidecar.
+
+    `<path>.npy` holds the L2-normalized float32 embeddings, one row per
+    document; `<path>.json` holds ids, texts, metadata and what the vectors
+    were built with. The matrix is memory-mapped on load and a search is one
+    matrix-vector product, which for ~100 articles is faster than an HNSW
+    lookup and never misses a neighbour. Writes copy the matrix into memory and
+    save both files again when the store has a path. The JSON is written last
+    and records the matrix's shape and hash, so a .npy from an interrupted or
+    concurrent save is detected on load.
+    """
+
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None, info: Optional[dict] = None):
+        self.embedding = embedding
+        self.path = path
+        self.info = info or {}
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._docs: List[Document] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self):
+        return len(self._ids)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, mmap: bool = True) -> Optional["SnapshotVectorStore"]:
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+            return None
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            matrix = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        except Exception as e:
+            print(f"Error loading snapshot {path}: {e}")
+            return None
+        if sidecar.get("format_version") != FORMAT_VERSION or matrix.shape[0] != len(sidecar.get("documents", [])):
+            print(f"Snapshot {path} is incomplete or from another format version, ignoring it")
+            return None
+        # Snapshots written before the matrix record only get the row count check above
+        if "matrix" in sidecar and _matrix_record(matrix) != sidecar["matrix"]:
+            print(f"Snapshot {path} has a matrix from another save, ignoring it")
+            return None
+        store = cls(embedding, path, sidecar.get("info", {}))
+        store._ids = [item["id"] for item in sidecar["documents"]]
+        store._docs = [Document(page_content=item["page_content"], metadata=item.get("metadata", {}))
+                       for item in sidecar["documents"]]
+        store._matrix = matrix
+        return store
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            matrix = np.asarray(self._matrix, dtype=np.float32)
+            sidecar = {
+                "format_version": FORMAT_VERSION,
+                "info": {**self.info, "saved_at": datetime.now().isoformat()},
+                "matrix": _matrix_record(matrix),
+                "documents": [
+                    {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}
+                    for doc_id, doc in zip(self._ids, self._docs)
+                ],
+            }
+            # Temp files of our own; the .npy goes first and replacing the .json commits the save.
+            # np.save appends .npy to a file name, not to an open file
+            tmp_path = f"{path}.npy.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, f"{path}.npy")
+            tmp_path = f"{path}.json.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sidecar, f, ensure_ascii=False)
+            os.replace(tmp_path, f"{path}.json")
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        vectors = _normalize_rows(np.asarray(self.embedding.embed_documents(texts), dtype=np.float32))
+        with self._lock:
+            matrix = np.array(self._matrix, dtype=np.float32)  # in-memory copy; the mmap is read-only
+            if not len(self._ids):
+                matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            new_rows = []
+            for doc_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                doc = Document(page_content=text, metadata=metadata or {})
+                if doc_id in positions:
+                    matrix[positions[doc_id]] = vector
+                    self._docs[positions[doc_id]] = doc
+                else:
+                    positions[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._docs.append(doc)
+                    new_rows.append(vector)
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self._matrix = matrix
+        if self.path:
+            self.save()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        remove = set(ids)
+        with self._lock:
+            keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in remove]
+            if len(keep) == len(self._ids):
+                return False
+            self._matrix = np.array(self._matrix[keep], dtype=np.float32)
+            self._ids = [self._ids[i] for i in keep]
+            self._docs = [self._docs[i] for i in keep]
+        if self.path:
+            self.save()
+        return True
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+            include: Optional[List[str]] = None, **kwargs: Any) -> dict:
+        """Chroma-style get(), enough for the keyword and article indexes to read the store."""
+        wanted = set(ids) if ids else None
+        with self._lock:
+            selected = [(doc_id, doc) for doc_id, doc in zip(self._ids, self._docs)
+                        if (wanted is None or doc_id in wanted) and _matches(doc.metadata, where)]
+        return {
+            "ids": [doc_id for doc_id, _ in selected],
+            "documents": [doc.page_content for _, doc in selected],
+            "metadatas": [doc.metadata for _, doc in selected],
+        }
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        with self._lock:
+            matrix, docs = self._matrix, self._docs
+        if not len(docs):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+        k = min(k, len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(docs[i], float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, path: Optional[str] = None, **kwargs: Any) -> "SnapshotVectorStore":
+        store = cls(embedding, path)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+def load_constitution_store(embedding: Embeddings) -> SnapshotVectorStore:
+    """The constitution collection as an exact-search snapshot.
+
+    Prefers the runtime copy under DB_DIR (which includes any pasted text),
+    then the prebuilt artifact shipped with the app if it was built from the
+    current PDF with the current embedding model. Otherwise returns an empty
+    store, which the normal ingestion path fills and saves under DB_DIR.
+    """
+    expected = embedding_id()
+    runtime = SnapshotVectorStore.load(RUNTIME_SNAPSHOT, embedding)
+    if runtime is not None and runtime.info.get("embedding") == expected:
+        print(f"Loaded constitution snapshot with {len(runtime)} documents from {RUNTIME_SNAPSHOT}")
+        return runtime
+
+    prebuilt = SnapshotVectorStore.load(CONSTITUTION_SNAPSHOT, embedding)
+    if prebuilt is not None:
+        if prebuilt.info.get("embedding") != expected:
+            print(f"Prebuilt snapshot was built with {prebuilt.info.get('embedding')}, not {expected}; ignoring it")
+        elif prebuilt.info.get("source_sha256") != file_sha256(CONSTITUTION_PATH):
+            print(f"Prebuilt snapshot does not match {CONSTITUTION_PATH}; ignoring it")
+        else:
+            print(f"Loaded prebuilt constitution snapshot with {len(prebuilt)} documents")
+            prebuilt.path = RUNTIME_SNAPSHOT
+            return prebuilt
+
+    return SnapshotVectorStore(embedding, RUNTIME_SNAPSHOT, {"embedding": expected})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prebuilt constitution embedding snapshot")
+    parser.add_argument("--pdf", default=CONSTITUTION_PATH)
+    parser.add_argument("--output", default=CONSTITUTION_SNAPSHOT, help="path prefix for the .npy and .json files")
+    args = parser.parse_args()
+
+    from constitution_qa import load_constitution_from_file
+    from ingestion import chunk_id
+    from resources import get_registry
+
+    docs = load_constitution_from_file(args.pdf)
+    if not docs:
+        raise SystemExit(f"No articles extracted from {args.pdf}")
+    store = SnapshotVectorStore(get_registry().embeddings(), info={
+        "embedding": embedding_id(),
+        "source": os.path.basename(args.pdf),
+        "source_sha256": file_sha256(args.pdf),
+        "built_at": datetime.now().isoformat(),
+    })
+    ids = [chunk_id(CONSTITUTION_COLLECTION, doc, i) for i, doc in enumerate(docs)]
+    store.add_documents(docs, ids=ids)
+    store.save(args.output)
+    print(f"Wrote {len(store)} documents ({store._matrix.shape[1]} dims) to {args.output}.npy and {args.output}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import time
+
+from answer_cache import SemanticAnswerCache
+
+PARTITION = SemanticAnswerCache.partition_key("Constitution", "constitution:1", [5])
+
+
+def test_similar_question_in_the_same_partition_hits():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put([1.0, 0.0, 0.1], PARTITION, "What does Article 5 say?", "answer")
+    assert cache.get([1.0, 0.0, 0.12], PARTITION) == "answer"
+    assert cache.get([0.0, 1.0, 0.0], PARTITION) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_partitions_keep_sources_versions_and_articles_apart():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put([1.0, 0.0], PARTITION, "q", "answer")
+    assert cache.get([1.0, 0.0], SemanticAnswerCache.partition_key("Both", "constitution:1", [5])) is None
+    assert cache.get([1.0, 0.0], SemanticAnswerCache.partition_key("Constitution", "constitution:2", [5])) is None
+    assert cache.get([1.0, 0.0], SemanticAnswerCache.partition_key("Constitution", "constitution:1", [6])) is None
+    assert SemanticAnswerCache.partition_key("Both", "v", [2, 1]) == SemanticAnswerCache.partition_key("Both", "v", [1, 2])
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+    cache.put([1.0, 0.0, 0.0], PARTITION, "a", "A")
+    cache.put([0.0, 1.0, 0.0], PARTITION, "b", "B")
+    assert cache.get([1.0, 0.0, 0.0], PARTITION) == "A"
+    cache.put([0.0, 0.0, 1.0], PARTITION, "c", "C")
+    assert cache.get([0.0, 1.0, 0.0], PARTITION) is None
+    assert cache.get([1.0, 0.0, 0.0], PARTITION) == "A"
+
+
+def test_expired_entries_are_not_served():
+    cache = SemanticAnswerCache(ttl=0.05)
+    cache.put([1.0, 0.0], PARTITION, "q", "answer")
+    time.sleep(0.1)
+    assert cache.get([1.0, 0.0], PARTITION) is None
+
+
+def test_persisted_cache_is_written_on_flush(tmp_path):
+    path = str(tmp_path / "answer_cache.json")
+    cache = SemanticAnswerCache(path=path, save_interval=60)
+    cache.put([1.0, 0.0], PARTITION, "q", "answer")
+    cache.flush()
+    assert SemanticAnswerCache(path=path).get([1.0, 0.0], PARTITION) == "answer"
@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+from api import app
+
+# Without a `with` block the lifespan (constitution load, compaction) does not run
+client = TestClient(app)
+
+
+def test_unknown_source_is_rejected():
+    response = client.post("/ask", json={"question": "q", "source": "Elsewhere"})
+    assert response.status_code == 400
+
+
+def test_ingest_validates_its_input():
+    assert client.post("/ingest", json={}).status_code == 400
+    response = client.post("/ingest", json={"files": [{"name": "a.txt", "content_base64": "not base64!"}]})
+    assert response.status_code == 400
+    assert "base64" in response.json()["detail"]
+
+
+def test_missing_article_is_404():
+    assert client.get("/articles/9999").status_code == 404
@@ -0,0 +1,68 @@
+from langchain.schema import Document
+
+from articles import ArticleIndex, parse_article_numbers, segment_articles
+
+
+def test_single_articles_and_lists():
+    assert parse_article_numbers("What does Article 5 say?") == [5]
+    assert parse_article_numbers("Compare Articles 5, 12 and 93") == [5, 12, 93]
+    assert parse_article_numbers("article 5 and 2 other things") == [5]
+
+
+def test_ranges():
+    assert parse_article_numbers("Articles 40-44") == [40, 41, 42, 43, 44]
+    assert parse_article_numbers("articles 2 through 4 and 7") == [2, 3, 4, 7]
+
+
+def test_reversed_range_keeps_both_ends():
+    assert parse_article_numbers("Articles 93-90") == [90, 91, 92, 93]
+    assert parse_article_numbers("article 10 to 5") == [5, 6, 7, 8, 9, 10]
+
+
+def test_too_wide_range_keeps_its_endpoints():
+    assert parse_article_numbers("Articles 1-200") == [1, 200]
+
+
+def test_inserted_article():
+    assert parse_article_numbers("What does Article 83-1 say?") == [83]
+
+
+def test_article_index_round_trip(tmp_path):
+    index = ArticleIndex(str(tmp_path / "articles.json"))
+    index.update([
+        Document(page_content="Article 1. First.", metadata={"article": 1}),
+        Document(page_content="No article here", metadata={}),
+        Document(page_content="Article 2. Second.", metadata={"article": 2}),
+    ])
+    loaded = ArticleIndex(index.path)
+    assert loaded.load()
+    assert len(loaded) == 2
+    assert [doc.page_content for doc in loaded.lookup([2, 3, 1])] == ["Article 2. Second.", "Article 1. First."]
+
+
+CONSTITUTION_TEXT = """Preamble text.
+Article 1
+1. The Republic of Kazakhstan is a democratic state.
+Article 2
+1. The Republic is unitary. As stated in Article 1, it is democratic.
+Article 3
+1. The people are the only source of state power.
+"""
+
+
+def test_segmenter_splits_on_headings_only():
+    docs = segment_articles(CONSTITUTION_TEXT)
+    assert [doc.metadata["article"] for doc in docs] == [1, 2, 3]
+    assert "As stated in Article 1, it is democratic." in docs[1].page_content
+    assert docs[0].page_content.startswith("Article 1. ")
+
+
+def test_segmenter_gives_same_result_for_any_chunking():
+    pieces = [CONSTITUTION_TEXT[i:i + 7] for i in range(0, len(CONSTITUTION_TEXT), 7)]
+    assert [doc.page_content for doc in segment_articles(pieces)] == \
+        [doc.page_content for doc in segment_articles(CONSTITUTION_TEXT)]
+
+
+def test_segmenter_without_line_breaks():
+    text = "Article 1 The state is democratic. Article 2 The Republic is unitary, see Article 1. Article 3 Power."
+    assert [doc.metadata["article"] for doc in segment_articles(text)] == [1, 2, 3]
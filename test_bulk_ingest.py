@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+
+from langchain.schema import Document
+
+from constitution_qa import get_keyword_index, get_vectorstore, sync_external_ingestion
+from resources import get_registry
+from settings import UPLOADS_COLLECTION
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def bulk_ingest(cwd, *args):
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "bulk_ingest.py"), *args, "--workers", "1"],
+                            cwd=cwd, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result.stdout
+
+
+def test_rerun_skips_finished_files_and_prune_removes_deleted_ones(tmp_path):
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    for i in range(5):
+        (tree / f"doc{i}.txt").write_text(f"Document {i} is about fisheries quota number {i}.")
+    env_db = os.environ["CQA_DB_DIR"]
+    bulk_ingest(tmp_path, "tree")
+    assert "0 ingested, 5 already loaded" in bulk_ingest(tmp_path, "tree")
+    (tree / "doc4.txt").unlink()
+    assert "Pruned" in bulk_ingest(tmp_path, "tree", "--prune")
+    with open(os.path.join(env_db, "ingestion_manifest.json"), encoding="utf-8") as f:
+        sources = json.load(f)["sources"][UPLOADS_COLLECTION]
+    assert sorted(name for name in sources if name.startswith("tree/")) == [f"tree/doc{i}.txt" for i in range(4)]
+
+
+def test_running_app_picks_up_another_process_ingestion(tmp_path):
+    registry = get_registry()
+    manifest = registry.manifest()
+    vectorstore = get_vectorstore(UPLOADS_COLLECTION)
+    vectorstore.add_documents([Document(page_content="seed text about courts", metadata={"source": "seed"})])
+    index = get_keyword_index(UPLOADS_COLLECTION)
+    index.ensure_loaded()
+    sync_external_ingestion()
+
+    (tmp_path / "zebra.txt").write_text("Zebra migration crosses the river every spring.")
+    bulk_ingest(tmp_path, "zebra.txt")
+    manifest._last_pop = None
+    assert sync_external_ingestion()
+    assert get_vectorstore(UPLOADS_COLLECTION) is vectorstore and get_keyword_index(UPLOADS_COLLECTION) is index
+    assert [d.page_content for d in index.search("zebra", 1)] == ["Zebra migration crosses the river every spring."]
+    found = vectorstore.similarity_search("Zebra migration crosses the river every spring.", k=1)
+    assert found[0].page_content == "Zebra migration crosses the river every spring."
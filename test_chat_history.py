@@ -0,0 +1,59 @@
+import threading
+import time
+
+from chat_history import ChatHistoryWriter
+
+
+class RecordingStore:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.called = threading.Event()
+
+    def add_documents(self, docs):
+        self.called.set()
+        if self.fail:
+            raise RuntimeError("store is down")
+        self.batches.append(list(docs))
+
+
+def test_full_batch_is_written_at_once():
+    store = RecordingStore()
+    writer = ChatHistoryWriter(store, batch_size=3, flush_interval=60)
+    for i in range(3):
+        writer.submit(f"q{i}", f"a{i}", {"session": "s"})
+    assert store.called.wait(5)
+    writer.close()
+    assert [len(batch) for batch in store.batches] == [3]
+    assert store.batches[0][0].page_content == "Q: q0\nA: a0"
+    assert store.batches[0][0].metadata["session"] == "s" and "timestamp" in store.batches[0][0].metadata
+
+
+def test_partial_batch_is_flushed_after_the_interval():
+    store = RecordingStore()
+    writer = ChatHistoryWriter(store, batch_size=100, flush_interval=0.05)
+    writer.submit("q", "a")
+    assert store.called.wait(5)
+    writer.close()
+    assert writer.written == 1
+
+
+def test_close_drains_the_queue():
+    store = RecordingStore()
+    writer = ChatHistoryWriter(store, batch_size=100, flush_interval=60)
+    for i in range(5):
+        writer.submit(f"q{i}", "a")
+    start = time.perf_counter()
+    writer.close()
+    assert time.perf_counter() - start < 5
+    assert sum(len(batch) for batch in store.batches) == 5
+    writer.submit("late", "a")
+    assert writer.written == 6
+
+
+def test_failed_writes_are_counted_not_raised():
+    store = RecordingStore(fail=True)
+    writer = ChatHistoryWriter(store, batch_size=1, flush_interval=60)
+    writer.submit("q", "a")
+    writer.close()
+    assert writer.failed == 1 and writer.written == 0
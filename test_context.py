@@ -0,0 +1,39 @@
+from langchain.schema import Document
+
+from context import ContextPacker, count_tokens, split_sentences
+
+
+def doc(text, article=None):
+    return Document(page_content=text, metadata={"article": article} if article is not None else {})
+
+
+def test_sentences_keep_their_numbering():
+    assert split_sentences("Article 5. 1. Citizens vote. 2. Courts decide.") == \
+        ["Article 5. 1. Citizens vote.", "2. Courts decide."]
+
+
+def test_duplicates_and_contained_chunks_are_dropped():
+    packer = ContextPacker(budget_tokens=1000)
+    docs = [doc("The president is elected for seven years."), doc("the president is  elected for seven years."),
+            doc("elected for seven years"), doc("Courts administer justice.")]
+    packed, stats = packer.pack("president term", docs)
+    assert [d.page_content for d in packed] == ["The president is elected for seven years.", "Courts administer justice."]
+    assert stats["duplicates"] == 2
+
+
+def test_long_chunks_are_trimmed_to_matching_sentences():
+    packer = ContextPacker(budget_tokens=1000)
+    text = "Section on taxes. Everyone pays taxes. The weather is mild. Rivers flow north."
+    packed, _ = packer.pack("Who pays taxes?", [doc(text)])
+    assert packed[0].page_content == "Section on taxes. Everyone pays taxes."
+
+
+def test_budget_is_respected_and_pinned_articles_go_first():
+    packer = ContextPacker(budget_tokens=40)
+    filler = [doc(f"Unrelated chunk number {i} about rivers and mountains and lakes.") for i in range(10)]
+    named = doc("Article 7. Kazakh is the state language. Russian is used officially.", article=7)
+    packed, stats = packer.pack("What does Article 7 say?", filler + [named], pinned=[7])
+    assert packed[0].metadata["article"] == 7
+    assert packed[0].page_content == named.page_content
+    assert sum(count_tokens(d.page_content) for d in packed) <= 40
+    assert stats["tokens_saved"] > 0
@@ -0,0 +1,68 @@
+from langchain.schema import Document
+
+from hybrid import HybridRetriever, KeywordIndex, reciprocal_rank_fusion, retrieval_executor
+
+
+def doc(text, source="s"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def loader(texts):
+    return lambda: ([f"id{i}" for i in range(len(texts))], list(texts), [{} for _ in texts])
+
+
+def test_rrf_rewards_documents_ranked_by_both_lists():
+    a, b, c = doc("a"), doc("b"), doc("c")
+    fused = reciprocal_rank_fusion([[a, b, c], [b, c]], k=3)
+    assert [d.page_content for d in fused] == ["b", "c", "a"]
+
+
+def test_rrf_merges_the_same_chunk_from_two_searches():
+    fused = reciprocal_rank_fusion([[doc("same")], [doc("same"), doc("other")]], k=5)
+    assert [d.page_content for d in fused] == ["same", "other"]
+
+
+def test_bm25_ranks_rare_terms_first():
+    index = KeywordIndex(loader(["citizens have rights", "citizens have duties", "fisheries quotas and citizens"]))
+    assert [d.page_content for d in index.search("fisheries citizens", 2)][0] == "fisheries quotas and citizens"
+    assert index.search("the of and", 2) == []
+
+
+def test_keyword_index_follows_upserts_and_deletes():
+    index = KeywordIndex(loader(["old text about courts"]))
+    index.upsert(["ignored"], [doc("before the first build")])
+    index.ensure_loaded()
+    assert len(index) == 1
+    index.upsert(["id0"], [doc("new text about taxes")])
+    index.upsert(["id1"], [doc("second text about courts")])
+    assert [d.page_content for d in index.search("taxes", 5)] == ["new text about taxes"]
+    assert [d.page_content for d in index.search("courts", 5)] == ["second text about courts"]
+    index.delete(["id1"])
+    assert index.search("courts", 5) == []
+
+
+class FixedStore:
+    def __init__(self, docs, fail=False):
+        self.docs, self.fail = docs, fail
+
+    def similarity_search_by_vector(self, embedding, k):
+        if self.fail:
+            raise RuntimeError("down")
+        return self.docs[:k]
+
+
+class FixedEmbeddings:
+    def embed_query(self, text):
+        return [1.0]
+
+
+def test_retriever_fuses_every_source_and_skips_failing_ones():
+    keyword = KeywordIndex(loader(["uploaded memo about fisheries"]))
+    retriever = HybridRetriever(
+        sources=[(FixedStore([doc("article text", "constitution")]), None),
+                 (FixedStore([doc("uploaded memo about fisheries", "upload")]), keyword),
+                 (FixedStore([], fail=True), None)],
+        embeddings=FixedEmbeddings(), executor=retrieval_executor(4), k=5,
+    )
+    results = retriever.retrieve("fisheries")
+    assert {d.page_content for d in results} == {"article text", "uploaded memo about fisheries"}
@@ -0,0 +1,160 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from ingestion import IngestionManifest, chunk_documents, chunk_id, content_hash, ingest_documents, parse_files
+
+
+class FakeStore:
+    def __init__(self):
+        self.docs = {}
+        self.added = 0
+        self._collection = self  # collection_count() asks the Chroma collection
+
+    def count(self):
+        return len(self.docs)
+
+    def add_documents(self, docs, ids):
+        self.added += len(docs)
+        self.docs.update(zip(ids, docs))
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.docs.pop(doc_id, None)
+
+
+def pages(*texts, source="a.txt"):
+    return [Document(page_content=text, metadata={"source": source, "chunk": i}) for i, text in enumerate(texts)]
+
+
+def test_chunk_ids_follow_position_not_content():
+    first, second = pages("one"), pages("changed")
+    assert chunk_id("docs", first[0], 0) == chunk_id("docs", second[0], 0)
+    assert chunk_id("docs", first[0], 0) != chunk_id("other", first[0], 0)
+    article = Document(page_content="Article 5. Text", metadata={"article": 5})
+    assert chunk_id("docs", article, 0) == chunk_id("docs", article, 7)
+
+
+def test_uploads_with_the_same_name_are_keyed_by_content():
+    a = Document(page_content="x", metadata={"source": "report.pdf", "file_hash": content_hash(b"a"), "chunk": 0})
+    b = Document(page_content="x", metadata={"source": "report.pdf", "file_hash": content_hash(b"b"), "chunk": 0})
+    assert chunk_id("docs", a, 0) != chunk_id("docs", b, 0)
+
+
+def test_only_new_or_changed_chunks_are_embedded(tmp_path):
+    store, manifest = FakeStore(), IngestionManifest(str(tmp_path / "manifest.json"))
+    assert ingest_documents(store, "docs", pages("one", "two", "three"), manifest, source="a.txt") == 3
+    assert ingest_documents(store, "docs", pages("one", "two", "three"), manifest, source="a.txt") == 0
+    assert ingest_documents(store, "docs", pages("one", "TWO"), manifest, source="a.txt") == 1
+    assert store.added == 4
+    assert sorted(doc.page_content for doc in store.docs.values()) == ["TWO", "one"]
+
+
+def test_manifest_survives_a_restart(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    store, manifest = FakeStore(), IngestionManifest(path)
+    ingest_documents(store, "docs", pages("one"), manifest, source="a.txt", file_hash=content_hash(b"one"))
+    reloaded = IngestionManifest(path)
+    assert reloaded.has_file("docs", content_hash(b"one"))
+    assert ingest_documents(store, "docs", pages("one"), reloaded, source="a.txt") == 0
+
+
+def test_empty_collection_discards_its_manifest_entries(tmp_path):
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+    ingest_documents(FakeStore(), "docs", pages("one"), manifest, source="a.txt")
+    assert ingest_documents(FakeStore(), "docs", pages("one"), manifest, source="a.txt") == 1
+
+
+def test_replaced_source_forgets_its_old_file_hash(tmp_path):
+    store, manifest = FakeStore(), IngestionManifest(str(tmp_path / "manifest.json"))
+    for text in ("version one", "version two", "version one"):
+        ingest_documents(store, "docs", pages(text), manifest, source="a.txt",
+                         file_hash=content_hash(text), name="a.txt")
+    assert list(manifest.files["docs"]) == [content_hash("version one")]
+    assert [doc.page_content for doc in store.docs.values()] == ["version one"]
+
+def test_deferred_save(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestionManifest(path)
+    ingest_documents(FakeStore(), "docs", pages("one"), manifest, source="a.txt", save=False)
+    assert not os.path.exists(path)
+    manifest.save()
+    assert IngestionManifest(path).sources["docs"]["a.txt"]
+
+
+def make_pdf(page_count):
+    import fitz
+    pdf = fitz.open()
+    for i in range(page_count):
+        pdf.new_page().insert_text((72, 72), f"Page number {i}")
+    return pdf.tobytes()
+
+
+def test_parse_files_shards_pdfs_and_keeps_page_order():
+    files = [("big.pdf", make_pdf(60)), ("notes.txt", b"plain text"), ("skip.exe", b"binary")]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        parsed = dict(parse_files(files, executor))
+    assert sorted(parsed) == ["big.pdf", "notes.txt"]
+    assert [doc.metadata["page"] for doc in parsed["big.pdf"]] == list(range(60))
+    assert parsed["notes.txt"][0].page_content == "plain text"
+
+
+def test_chunk_documents_numbers_chunks_per_document():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=0)
+    chunks = chunk_documents([Document(page_content="word " * 20, metadata={"source": "a.txt"})], splitter)
+    assert len(chunks) > 1
+    assert [chunk.metadata["chunk"] for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk.metadata["source"] == "a.txt" for chunk in chunks)
+
+
+def test_concurrent_saves_merge(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    ours, theirs = IngestionManifest(path), IngestionManifest(path)
+    ours.record_file("docs", "a", "a.txt", 1)
+    ours.bump_version("docs")
+    ours.save()
+    theirs.record_file("docs", "b", "b.txt", 1)
+    theirs.bump_version("docs")
+    theirs.save()
+    ours.forget_files("docs", "a.txt")
+    ours.save()
+    merged = IngestionManifest(path)
+    assert list(merged.files["docs"]) == ["b"]
+    assert merged.versions["docs"] == 2
+
+
+def test_external_changes_are_reported_once_per_interval(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    app, cli = IngestionManifest(path), IngestionManifest(path)
+    store = FakeStore()
+    ingest_documents(store, "docs", pages("one", "two"), cli, source="a.txt")
+    assert app.reload_if_changed()
+    changes = app.pop_external_changes(min_interval=60)
+    assert changes["docs"]["changed"] == set(store.docs)
+    ingest_documents(store, "docs", pages("one"), cli, source="a.txt")
+    app.reload_if_changed()
+    assert app.pop_external_changes(min_interval=60) == {}
+    assert len(app.pop_external_changes()["docs"]["removed"]) == 1
+
+
+SAVER = """
+import sys
+from ingestion import IngestionManifest
+manifest = IngestionManifest(sys.argv[1])
+for i in range(int(sys.argv[3])):
+    manifest.record_file("docs", f"{sys.argv[2]}{i}", f"{sys.argv[2]}{i}.txt", 1)
+    manifest.save()
+"""
+
+
+def test_saves_from_several_processes_keep_every_entry(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    root = os.path.dirname(os.path.abspath(__file__))
+    procs = [subprocess.Popen([sys.executable, "-c", SAVER, path, prefix, "50"], cwd=root)
+             for prefix in ("p", "q", "r")]
+    assert all(proc.wait() == 0 for proc in procs)
+    assert len(IngestionManifest(path).files["docs"]) == 150
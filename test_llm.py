@@ -0,0 +1,59 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm import OllamaClient, PooledOllama
+
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lines = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.peers.add(self.client_address)
+        body = "".join(json.dumps(line) + "\n" for line in self.lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StreamingHandler)
+    server.peers = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_tokens_stream_in_order_over_one_connection(ollama):
+    StreamingHandler.lines = [{"response": "Hello"}, {"response": ", world"}, {"done": True}]
+    client = OllamaClient(base_url=f"http://127.0.0.1:{ollama.server_port}")
+    assert list(client.stream("hi")) == ["Hello", ", world"]
+    assert client.generate("hi again") == "Hello, world"
+    assert len(ollama.peers) == 1
+    client.close()
+
+
+def test_langchain_llm_streams_chunks(ollama):
+    StreamingHandler.lines = [{"response": "a"}, {"response": "b"}, {"done": True}]
+    llm = PooledOllama(client=OllamaClient(base_url=f"http://127.0.0.1:{ollama.server_port}"))
+    assert list(llm.stream("prompt")) == ["a", "b"]
+    assert llm.invoke("prompt") == "ab"
+
+
+def test_error_line_raises(ollama):
+    StreamingHandler.lines = [{"error": "model not found"}]
+    client = OllamaClient(base_url=f"http://127.0.0.1:{ollama.server_port}")
+    with pytest.raises(RuntimeError, match="model not found"):
+        list(client.stream("hi"))
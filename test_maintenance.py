@@ -0,0 +1,99 @@
+import os
+
+import chromadb
+import pytest
+
+from maintenance import (QUARANTINE_DIR, check_collections, find_orphan_segments, inspect_segment,
+                         rebuild_collection, startup_check)
+
+
+def make_db(path, records=30):
+    client = chromadb.PersistentClient(path=str(path), settings=chromadb.Settings(anonymized_telemetry=False))
+    # A low sync threshold makes Chroma write header.bin and the id maps for a few records
+    collection = client.create_collection("docs", metadata={"hnsw:sync_threshold": 10, "hnsw:batch_size": 10})
+    collection.add(ids=[f"id{i}" for i in range(records)], embeddings=[[float(i), 1.0, 0.5] for i in range(records)],
+                   documents=[f"document {i}" for i in range(records)])
+    return client, collection
+
+
+def segment_dir(path):
+    return os.path.join(str(path), check_collections(str(path))["docs"]["segment"])
+
+
+def test_healthy_segment_header_matches_its_files(tmp_path):
+    make_db(tmp_path)
+    info = check_collections(str(tmp_path))["docs"]
+    assert info["problems"] == []
+    assert info["records"] == 30 and info["vectors"] == 30 and info["added"] == 30
+    assert info["deleted_ratio"] == 0.0
+
+
+def test_deleted_records_raise_the_deleted_ratio(tmp_path):
+    _, collection = make_db(tmp_path)
+    collection.delete(ids=[f"id{i}" for i in range(15)])
+    assert check_collections(str(tmp_path))["docs"]["deleted_ratio"] == pytest.approx(0.5)
+
+
+def test_truncated_files_and_header_are_reported(tmp_path):
+    make_db(tmp_path)
+    path = segment_dir(tmp_path)
+    with open(os.path.join(path, "data_level0.bin"), "r+b") as f:
+        f.truncate(10)
+    assert any(p.startswith("data_level0.bin") for p in inspect_segment(path)["problems"])
+    with open(os.path.join(path, "header.bin"), "r+b") as f:
+        f.truncate(5)
+    assert inspect_segment(path)["problems"][0].startswith("unreadable header.bin")
+
+
+def test_segment_below_sync_threshold_is_not_checked(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path), settings=chromadb.Settings(anonymized_telemetry=False))
+    client.create_collection("docs").add(ids=["a"], embeddings=[[1.0, 0.0, 0.0]])
+    info = check_collections(str(tmp_path))["docs"]
+    assert info["problems"] == [] and info["records"] == 1 and info["vectors"] == 0
+
+
+def test_dry_run_reports_damage_without_quarantining(tmp_path):
+    make_db(tmp_path)
+    path = segment_dir(tmp_path)
+    with open(os.path.join(path, "length.bin"), "r+b") as f:
+        f.truncate(0)
+    result = startup_check(str(tmp_path), dry_run=True)
+    assert result["status"] == "damaged" and result["repaired"] == ["docs"]
+    assert os.path.isdir(path) and not os.path.exists(os.path.join(str(tmp_path), QUARANTINE_DIR))
+
+    result = startup_check(str(tmp_path))
+    assert result["status"] == "repaired" and not os.path.exists(path)
+
+
+def test_orphaned_segment_dirs_are_found(tmp_path):
+    make_db(tmp_path)
+    orphan = "0b5e2c3a-6f0e-4a51-9d53-5a8f3c1d2e4f"
+    os.makedirs(os.path.join(str(tmp_path), orphan))
+    os.makedirs(os.path.join(str(tmp_path), "not-a-segment"))
+    assert find_orphan_segments(str(tmp_path)) == [orphan]
+    assert startup_check(str(tmp_path), dry_run=True)["orphans"] == [orphan]
+    assert os.path.isdir(os.path.join(str(tmp_path), orphan))
+
+
+def test_rebuild_keeps_records_and_vectors(tmp_path):
+    client, collection = make_db(tmp_path)
+    collection.delete(ids=["id0", "id1"])
+    rebuilt = rebuild_collection(client, "docs", batch_size=7)
+    assert [c.name for c in client.list_collections()] == ["docs"]
+    assert rebuilt.count() == 28
+    record = rebuilt.get(ids=["id5"], include=["documents", "embeddings"])
+    assert record["documents"] == ["document 5"] and list(record["embeddings"][0]) == [5.0, 1.0, 0.5]
+    assert rebuilt.metadata["hnsw:sync_threshold"] == 10
+
+
+class FailingEmbedding:
+    def embed_documents(self, texts):
+        raise RuntimeError("embedding server down")
+
+
+def test_failed_rebuild_leaves_the_old_collection(tmp_path):
+    client, _ = make_db(tmp_path)
+    with pytest.raises(RuntimeError):
+        rebuild_collection(client, "docs", embedding=FailingEmbedding())
+    assert [c.name for c in client.list_collections()] == ["docs"]
+    assert client.get_collection("docs").count() == 30
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import chromadb
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import Chroma
+
+from chat_history import ChatHistoryWriter
+from context import count_tokens
+from ingestion import IngestionManifest
+from memory import CompactionScheduler, ConversationMemory, MemoryStore, compact_chat_history, try_lock
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def chat_store(db_dir):
+    client = chromadb.PersistentClient(db_dir, settings=chromadb.Settings(anonymized_telemetry=False))
+    return Chroma(client=client, collection_name="chat_history", embedding_function=DeterministicFakeEmbedding(size=16))
+
+
+def add_turns(vectorstore, *ages_in_days):
+    now = datetime.now()
+    vectorstore.add_texts([f"Q: turn {age}\nA: a" for age in ages_in_days],
+                          metadatas=[{"timestamp": (now - timedelta(days=age)).isoformat()} for age in ages_in_days])
+
+
+def test_window_and_summary_stay_within_budget():
+    memory = ConversationMemory("s", window=2, summary_tokens=30, budget_tokens=120)
+    for i in range(10):
+        memory.add_turn(f"What does Article {i} say about rights and duties?", "It says a great deal. " * 10)
+    assert len(memory.turns) == 2 and memory.has_older_turns()
+    rendered = memory.render()
+    assert "Article 9" in rendered and "Summary of earlier conversation" in rendered
+    assert count_tokens(rendered) <= 120 + 10
+    assert memory.in_window("Q: What does Article 9 say about rights and duties?\nA: " + "It says a great deal. " * 10)
+
+
+def test_memory_store_drops_least_recent_session():
+    store = MemoryStore(max_sessions=2)
+    first = store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert store.get("a") is first
+    assert "b" not in store._memories
+
+
+def test_compaction_evicts_old_turns_and_bumps_the_version(tmp_path):
+    vectorstore = chat_store(str(tmp_path))
+    add_turns(vectorstore, 1, 2, 60)
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+    result = compact_chat_history(vectorstore, max_age_days=30, max_entries=0, manifest=manifest)
+    assert result == {"kept": 2, "evicted": 1, "rebuilt": True}
+    assert vectorstore._collection.count() == 2
+    assert IngestionManifest(manifest.path).versions["chat_history"] == 1
+
+
+COMPACT = """
+import sys
+sys.path.insert(0, sys.argv[2])
+from ingestion import IngestionManifest
+from memory import compact_chat_history
+from test_memory import chat_store
+print(compact_chat_history(chat_store(sys.argv[1]), max_age_days=30, max_entries=0,
+                           manifest=IngestionManifest(sys.argv[1] + "/manifest.json")))
+"""
+
+
+def test_writer_follows_compaction_in_another_process(tmp_path):
+    db_dir = str(tmp_path)
+    vectorstore = chat_store(db_dir)
+    add_turns(vectorstore, 1, 60)
+    manifest = IngestionManifest(os.path.join(db_dir, "manifest.json"))
+    old_id = vectorstore._collection.id
+    writer = ChatHistoryWriter(vectorstore, batch_size=1, flush_interval=60)
+
+    subprocess.run([sys.executable, "-c", COMPACT, db_dir, ROOT], cwd=ROOT, check=True)
+    writer.submit("asked after compaction", "answer")
+    writer.close()
+
+    live = vectorstore._client.get_collection("chat_history")
+    assert live.id != old_id
+    assert sorted(live.get()["documents"]) == ["Q: asked after compaction\nA: answer", "Q: turn 1\nA: a"]
+    assert manifest.reload_if_changed()
+    assert "chat_history" in manifest.pop_external_changes()
+
+
+def test_scheduler_runs_only_while_holding_the_lock(tmp_path):
+    path = str(tmp_path / "chat_compaction.lock")
+    held = try_lock(path)
+    assert held is not None and try_lock(path) is None
+    ran = threading.Event()
+    scheduler = CompactionScheduler(ran.set, interval=0.05, initial_delay=0.01, lock_path=path)
+    assert not ran.wait(0.3)
+    held.close()
+    assert ran.wait(5)
+    scheduler.close()
+
+
+def test_answer_cache_is_bypassed_with_conversation_history():
+    from constitution_qa import finish_answer, lookup_cached_answer
+    question = "What does Article 12 say about property?"
+    answer, embedding, partition = lookup_cached_answer(question, "Constitution")
+    assert answer is None and partition is not None
+    finish_answer(question, "cached answer", embedding, partition)
+    assert lookup_cached_answer(question, "Constitution")[0] == "cached answer"
+    memory = ConversationMemory("s")
+    memory.add_turn("What is Article 1?", "It founds the state.")
+    assert lookup_cached_answer(question, "Constitution", memory) == (None, embedding, None)
@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from query_batcher import BatchingEmbeddings
+
+
+class CountingEmbeddings:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_concurrent_queries_share_a_batch():
+    inner = CountingEmbeddings()
+    batcher = BatchingEmbeddings(inner, max_batch=16, max_wait_ms=200)
+    results = {}
+    threads = [threading.Thread(target=lambda t=t: results.update({t: batcher.embed_query(t)}))
+               for t in ["a", "bb", "ccc", "dddd"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0], "dddd": [4.0]}
+    assert len(inner.calls) < 4 and sum(inner.calls) == 4
+    assert batcher.stats()["queries"] == 4
+
+
+def test_errors_reach_every_caller():
+    batcher = BatchingEmbeddings(CountingEmbeddings(fail=True), max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="model crashed"):
+        batcher.embed_query("question")
@@ -0,0 +1,150 @@
+import threading
+import time
+
+from resources import ResourceRegistry
+
+
+def test_chroma_client_is_shared(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.chroma_client())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(client is clients[0] for client in clients)
+
+
+def test_slow_embedding_load_does_not_block_other_handles(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    ResourceRegistry(str(tmp_path / "warm")).llm()  # pay the import once, outside the timing
+    release = threading.Event()
+    registry._load_embeddings = lambda: release.wait(5) and "embeddings"
+    loader = threading.Thread(target=registry.embeddings)
+    loader.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    registry.chroma_client()
+    registry.llm()
+    assert time.monotonic() - start < 1
+    release.set()
+    loader.join()
+    assert registry.embeddings() == "embeddings"
+
+
+def test_get_or_create_builds_once(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(registry.get_or_create("key", factory)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(value is values[0] for value in values)
+
+
+def test_slow_factory_does_not_block_other_keys(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.5)
+        return "slow"
+
+    thread = threading.Thread(target=registry.get_or_create, args=("slow", slow))
+    thread.start()
+    started.wait()
+    start = time.perf_counter()
+    assert registry.get_or_create("fast", lambda: "fast") == "fast"
+    assert time.perf_counter() - start < 0.25
+    thread.join()
+
+
+def test_invalidate_drops_cached_values(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    first = registry.get_or_create(("chain", "a"), object)
+    registry.invalidate("chain")
+    assert registry.get_or_create(("chain", "a"), object) is not first
+
+
+def test_client_reset_while_building_builds_again(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    built = []
+
+    def factory():
+        built.append(object())
+        if len(built) == 1:
+            started.set()
+            release.wait()
+        return built[-1]
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(registry.get_or_create(("vectorstore", "a"), factory)))
+    thread.start()
+    started.wait()
+    registry.reset_chroma_client()
+    release.set()
+    thread.join()
+    assert len(built) == 2
+    assert result[0] is built[1] and registry.get_or_create(("vectorstore", "a"), object) is built[1]
+
+
+def test_discard_while_building_builds_again(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    built = []
+
+    def factory():
+        built.append(object())
+        if len(built) == 1:
+            started.set()
+            release.wait()
+        return built[-1]
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(registry.get_or_create("store", factory)))
+    thread.start()
+    started.wait()
+    registry.discard("store")
+    release.set()
+    thread.join()
+    assert len(built) == 2
+    assert result[0] is built[1] and registry.cached("store") is built[1]
+
+
+def test_concurrent_discard_never_raises(tmp_path):
+    registry = ResourceRegistry(str(tmp_path))
+    stop, errors = threading.Event(), []
+
+    def churn():
+        while not stop.is_set():
+            registry.discard("key")
+
+    def lookup():
+        for _ in range(2000):
+            try:
+                assert registry.get_or_create("key", object) is not None
+            except Exception as e:
+                errors.append(e)
+
+    churner = threading.Thread(target=churn)
+    churner.start()
+    lookups = [threading.Thread(target=lookup) for _ in range(4)]
+    for thread in lookups:
+        thread.start()
+    for thread in lookups:
+        thread.join()
+    stop.set()
+    churner.join()
+    assert errors == []
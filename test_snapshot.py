@@ -0,0 +1,59 @@
+import json
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from snapshot import SnapshotVectorStore
+
+EMBEDDING = DeterministicFakeEmbedding(size=16)
+
+
+def test_exact_search_finds_the_identical_text():
+    store = SnapshotVectorStore(EMBEDDING)
+    store.add_texts(["Article 1. Democracy.", "Article 2. Unitary state.", "Article 3. The people."],
+                    metadatas=[{"article": 1}, {"article": 2}, {"article": 3}], ids=["a1", "a2", "a3"])
+    results = store.similarity_search_with_score("Article 2. Unitary state.", k=2)
+    assert results[0][0].metadata == {"article": 2}
+    assert abs(results[0][1] - 1.0) < 1e-5
+    assert store.get(where={"article": {"$gte": 2}})["ids"] == ["a2", "a3"]
+
+
+def test_upsert_and_delete_by_id():
+    store = SnapshotVectorStore(EMBEDDING)
+    store.add_texts(["one", "two"], ids=["1", "2"])
+    store.add_texts(["TWO"], ids=["2"])
+    assert store.get()["documents"] == ["one", "TWO"]
+    assert store.delete(["1"])
+    assert store.get()["ids"] == ["2"] and store._matrix.shape == (1, 16)
+
+
+def test_saved_snapshot_loads_memory_mapped(tmp_path):
+    path = str(tmp_path / "snapshot")
+    store = SnapshotVectorStore(EMBEDDING, path, {"embedding": "fake"})
+    store.add_texts(["one", "two"], ids=["1", "2"])
+    loaded = SnapshotVectorStore.load(path, EMBEDDING)
+    assert loaded.info["embedding"] == "fake"
+    assert loaded.similarity_search("two", k=1)[0].page_content == "two"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["snapshot.json", "snapshot.npy"]
+
+
+def test_matrix_from_another_save_is_ignored(tmp_path):
+    path = str(tmp_path / "snapshot")
+    store = SnapshotVectorStore(EMBEDDING, path)
+    store.add_texts(["one", "two"], ids=["1", "2"])
+    committed = open(f"{path}.json", encoding="utf-8").read()
+    store.add_texts(["changed"], ids=["2"])
+    # As if the process died after replacing the .npy but before the .json
+    with open(f"{path}.json", "w", encoding="utf-8") as f:
+        f.write(committed)
+    assert SnapshotVectorStore.load(path, EMBEDDING) is None
+
+
+def test_row_count_mismatch_is_ignored(tmp_path):
+    path = str(tmp_path / "snapshot")
+    store = SnapshotVectorStore(EMBEDDING, path)
+    store.add_texts(["one", "two"], ids=["1", "2"])
+    sidecar = json.load(open(f"{path}.json", encoding="utf-8"))
+    sidecar["documents"].pop()
+    del sidecar["matrix"]
+    json.dump(sidecar, open(f"{path}.json", "w", encoding="utf-8"))
+    assert SnapshotVectorStore.load(path, EMBEDDING) is None
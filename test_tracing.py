@@ -0,0 +1,35 @@
+import time
+
+from tracing import Tracer
+
+
+def test_spans_and_counters_are_summarised():
+    tracer = Tracer(enabled=True, debug_level=0)
+    for _ in range(3):
+        with tracer.span("retrieve"):
+            time.sleep(0.01)
+    tracer.record("first_token", 0.5)
+    tracer.incr("questions")
+    tracer.incr("questions", 2)
+    snapshot = tracer.snapshot()
+    assert snapshot["spans"]["retrieve"]["count"] == 3
+    assert snapshot["spans"]["retrieve"]["p50_ms"] >= 10
+    assert snapshot["spans"]["first_token"]["max_ms"] == 500
+    assert snapshot["counters"] == {"questions": 3}
+
+
+def test_prometheus_export():
+    tracer = Tracer(enabled=True, debug_level=0)
+    tracer.record("embed", 0.25)
+    tracer.incr("cache_hits")
+    text = tracer.prometheus()
+    assert 'cqa_span_seconds_count{span="embed"} 1' in text
+    assert "cqa_cache_hits_total 1" in text
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False, debug_level=0)
+    with tracer.span("retrieve"):
+        pass
+    tracer.incr("questions")
+    assert tracer.snapshot() == {"spans": {}, "counters": {}}
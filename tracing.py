@@ -0,0 +1,116 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict
+
+import numpy as np
+
+from settings import DEBUG_LEVEL, METRICS_ENABLED, METRICS_FILE
+
+# Spans keep this many recent durations each for percentiles; count and sum cover every call
+SPAN_SAMPLES = 1024
+
+
+class Tracer:
+    """In-process latency spans and counters, exported as JSON or Prometheus text.
+
+    span() times a block, record() adds a duration measured elsewhere (e.g.
+    time to first LLM token), incr() bumps a counter. With a debug level of 1
+    or more every finished span is also printed.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, debug_level: int = DEBUG_LEVEL):
+        self.enabled = enabled
+        self.debug_level = debug_level
+        self._lock = threading.Lock()
+        self._spans: Dict[str, dict] = {}
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, **attributes)
+
+    def record(self, name: str, seconds: float, **attributes):
+        if not self.enabled:
+            return
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = {"count": 0, "sum": 0.0, "max": 0.0, "samples": deque(maxlen=SPAN_SAMPLES)}
+            span["count"] += 1
+            span["sum"] += seconds
+            span["max"] = max(span["max"], seconds)
+            span["samples"].append(seconds)
+        if self.debug_level >= 1:
+            details = " ".join(f"{k}={v}" for k, v in attributes.items())
+            print(f"[trace] {name} {seconds * 1000:.1f} ms {details}".rstrip())
+
+    def incr(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += value
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            spans = {name: (dict(span), list(span["samples"])) for name, span in self._spans.items()}
+            counters = dict(self._counters)
+        result = {"spans": {}, "counters": counters}
+        for name, (span, samples) in sorted(spans.items()):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if samples else (0.0, 0.0, 0.0)
+            result["spans"][name] = {
+                "count": span["count"],
+                "sum_s": span["sum"],
+                "mean_ms": span["sum"] / span["count"] * 1000,
+                "p50_ms": float(p50) * 1000,
+                "p95_ms": float(p95) * 1000,
+                "p99_ms": float(p99) * 1000,
+                "max_ms": span["max"] * 1000,
+            }
+        return result
+
+    def prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP cqa_span_seconds Latency of instrumented stages",
+            "# TYPE cqa_span_seconds summary",
+        ]
+        for name, span in snapshot["spans"].items():
+            for quantile in ("50", "95", "99"):
+                lines.append(f'cqa_span_seconds{{span="{name}",quantile="0.{quantile}"}} {span[f"p{quantile}_ms"] / 1000:.6f}')
+            lines.append(f'cqa_span_seconds_sum{{span="{name}"}} {span["sum_s"]:.6f}')
+            lines.append(f'cqa_span_seconds_count{{span="{name}"}} {span["count"]}')
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE cqa_{name}_total counter")
+            lines.append(f"cqa_{name}_total {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+tracer = Tracer()
+span = tracer.span
+record = tracer.record
+incr = tracer.incr
+
+if METRICS_FILE:
+    atexit.register(tracer.write_json, METRICS_FILE)